@@ -1,23 +1,50 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from .models import Base
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+
+def get_async_database_url(url):
+    url = make_url(url)
+    if url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+
+    # asyncpg takes "ssl" where libpq takes "sslmode".
+    sslmode = url.query.get("sslmode")
+    if sslmode is not None:
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+
+    return url
+
 
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    get_async_database_url(DATABASE_URL),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 def get_metadata():
     return Base.metadata
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""add hot path indexes
+
+Revision ID: 4f1d2c9a7b3e
+Revises: 32213e518faf
+Create Date: 2026-10-18 10:12:40.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1d2c9a7b3e'
+down_revision: Union[str, None] = '32213e518faf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_User_email', 'User', ['email'], unique=True)
+    op.create_index('ix_Chat_user_id_created_at', 'Chat', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_Message_chat_id_created_at', 'Message', ['chat_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_Message_chat_id_created_at', table_name='Message')
+    op.drop_index('ix_Chat_user_id_created_at', table_name='Chat')
+    op.drop_index('ix_User_email', table_name='User')
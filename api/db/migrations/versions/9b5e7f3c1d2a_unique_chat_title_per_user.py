@@ -0,0 +1,28 @@
+"""unique chat title per user
+
+Revision ID: 9b5e7f3c1d2a
+Revises: 4f1d2c9a7b3e
+Create Date: 2026-10-18 14:05:12.734810
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b5e7f3c1d2a'
+down_revision: Union[str, None] = '4f1d2c9a7b3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_Chat_user_id_title', 'Chat', ['user_id', 'title'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_Chat_user_id_title', table_name='Chat')
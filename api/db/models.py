@@ -5,31 +5,34 @@ from sqlalchemy import (
     Text,
     ForeignKey,
     JSON,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base, relationship, validates
+from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 import uuid as uuid_lib
-from api.db.utils.hashing import hash_password
 
 Base = declarative_base()
 
 class User(Base):
     __tablename__ = "User"
+    __table_args__ = (
+        Index("ix_User_email", "email", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4, nullable=False)
     email = Column(String(64), nullable=False)
     password = Column(String(128), nullable=False)
 
-    @validates("password")
-    def validate_password(self, user_password):
-        return hash_password(user_password)
-
     chats = relationship("Chat", back_populates="user")
 
 
 class Chat(Base):
     __tablename__ = "Chat"
+    __table_args__ = (
+        Index("ix_Chat_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_Chat_user_id_title", "user_id", "title", unique=True),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4, nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -37,11 +40,16 @@ class Chat(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("User.id", ondelete="CASCADE"), nullable=False)
 
     user = relationship("User", back_populates="chats")
-    messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
+    # Messages are removed by the FK's ON DELETE CASCADE, not loaded and
+    # deleted one by one.
+    messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Message(Base):
     __tablename__ = "Message"
+    __table_args__ = (
+        Index("ix_Message_chat_id_created_at", "chat_id", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid_lib.uuid4, nullable=False)
     chat_id = Column(UUID(as_uuid=True), ForeignKey("Chat.id", ondelete="CASCADE"), nullable=False)
@@ -1,30 +1,107 @@
-from api.db.database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy import select, tuple_, func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.db import models
+from datetime import datetime
 from uuid import UUID
+import base64
 
 
-def getUserwithEmail(db: Session, email: str):
-    return db.query(models.User).filter(
-        models.User.email == email
-    ).first()
+SNIPPET_LENGTH = 200
 
 
-def getMessagesByChatId(db: Session, chat_id: UUID):
-    return db.query(models.Message).filter(
-            models.Message.chat_id == chat_id
-        ).order_by(
-            models.Message.created_at
-        ).all()
+def encode_cursor(created_at: datetime, id: UUID):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode()
 
 
-def getChatbyUserId(db: Session, user_id: UUID):
-    return db.query(models.Chat).filter(
-            models.Chat.user_id == user_id
-        ).all()
+def decode_cursor(cursor: str):
+    created_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(created_at), UUID(id)
 
 
-def getChatById(db: Session, chat_id: UUID):
-    return db.query(models.Chat).filter(
+def split_page(rows, limit):
+    # Pages are fetched with one extra row, which only tells whether another
+    # page exists; the cursor points at the last row that is returned.
+    if not limit or len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last["created_at"], last["id"])
+    return rows, encode_cursor(last.created_at, last.id)
+
+
+def paginate(query, created_at, id, limit=None, after=None):
+    query = query.order_by(created_at, id)
+    if after:
+        query = query.where(tuple_(created_at, id) > tuple_(*decode_cursor(after)))
+    if limit:
+        query = query.limit(limit + 1)
+    return query
+
+
+async def getUserwithEmail(db: AsyncSession, email: str):
+    result = await db.execute(
+        select(models.User).where(
+            models.User.email == email
+        )
+    )
+    return result.scalars().first()
+
+
+async def getMessagesByChatId(db: AsyncSession, chat_id: UUID, limit: int = None, after: str = None, summary: bool = False):
+    if summary:
+        # Content is a JSON string; #>> '{}' unwraps it to text before slicing.
+        columns = (
+            models.Message.id,
+            models.Message.role,
+            models.Message.image_url,
+            models.Message.created_at,
+            func.left(models.Message.content.op("#>>")(literal_column("'{}'")), SNIPPET_LENGTH).label("snippet"),
+        )
+    else:
+        columns = (models.Message,)
+
+    result = await db.execute(
+        paginate(
+            select(*columns).where(
+                models.Message.chat_id == chat_id
+            ),
+            models.Message.created_at,
+            models.Message.id,
+            limit=limit,
+            after=after,
+        )
+    )
+    rows = [dict(row) for row in result.mappings()] if summary else result.scalars().all()
+    return split_page(rows, limit)
+
+
+async def getChatbyUserId(db: AsyncSession, user_id: UUID, limit: int = None, after: str = None, summary: bool = False):
+    if summary:
+        columns = (models.Chat.id, models.Chat.title, models.Chat.created_at)
+    else:
+        columns = (models.Chat,)
+
+    result = await db.execute(
+        paginate(
+            select(*columns).where(
+                models.Chat.user_id == user_id
+            ),
+            models.Chat.created_at,
+            models.Chat.id,
+            limit=limit,
+            after=after,
+        )
+    )
+    rows = [dict(row) for row in result.mappings()] if summary else result.scalars().all()
+    return split_page(rows, limit)
+
+
+async def getChatById(db: AsyncSession, chat_id: UUID):
+    result = await db.execute(
+        select(models.Chat).where(
             models.Chat.id == chat_id
-        ).first()
\ No newline at end of file
+        )
+    )
+    return result.scalars().first()
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+import hashlib
+import time
+import os
+load_dotenv()
+
+
+CHAT_LIST_CACHE_SIZE = int(os.getenv("CHAT_LIST_CACHE_SIZE", "1024"))
+# Each worker keeps its own cache; the TTL bounds how long a list changed
+# through another worker can be served stale.
+CHAT_LIST_CACHE_TTL = float(os.getenv("CHAT_LIST_CACHE_TTL", "300"))
+
+
+@dataclass
+class CachedChatList:
+    body: bytes
+    etag: str
+    cursor: str
+    stored_at: float
+
+
+# Per-user cache of rendered chat-list pages (one entry per limit / cursor /
+# view). create, update and delete drop the user's entries; the version
+# counter stops a read that raced with one of them from storing its result.
+class ChatListCache:
+    def __init__(self, max_users=CHAT_LIST_CACHE_SIZE, ttl=CHAT_LIST_CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._versions = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, user_id, key):
+        pages = self._users.get(user_id)
+        entry = pages.get(key) if pages is not None else None
+
+        if entry is None or time.monotonic() - entry.stored_at > self.ttl:
+            self.misses += 1
+            return None
+
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return entry
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def set(self, user_id, key, version, chats, cursor):
+        body = JSONResponse(jsonable_encoder(chats)).body
+        entry = CachedChatList(
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            cursor=cursor,
+            stored_at=time.monotonic(),
+        )
+
+        if version == self.version(user_id):
+            self._users.setdefault(user_id, {})[key] = entry
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                evicted, _ = self._users.popitem(last=False)
+                self._versions.pop(evicted, None)
+
+        return entry
+
+    def invalidate(self, user_id):
+        self._users.pop(user_id, None)
+        self._versions[user_id] = self.version(user_id) + 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+chat_list_cache = ChatListCache()
@@ -1,17 +1,175 @@
 import asyncio
-from langchain.memory import ConversationBufferWindowMemory
+import re
+from collections import OrderedDict, deque
 from uuid import UUID
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.db import models
+from api.db.utils.message_writer import enqueue_message, unflushed_messages
+from api.db.utils.metrics import MetricsCallbackHandler, observe
+from dotenv import load_dotenv
+import time
+import os
+load_dotenv()
 
 
-async def generate_stream(runnable, input_text):
-    async for chunk in runnable.astream(input_text):
-        yield f"data: {chunk}\n\n"
-        await asyncio.sleep(0.05)
+MEMORY_WINDOW = 10
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "1024"))
+# Each worker keeps its own windows; the TTL bounds how long messages written
+# through another worker can be missing from one.
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "60"))
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "512"))
+STREAM_MAX_BUFFER_BYTES = int(os.getenv("STREAM_MAX_BUFFER_BYTES", "262144"))
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
 
+# Write-through cache of the last MEMORY_WINDOW (role, content) pairs per chat,
+# so follow-up questions can build their memory without a DB round trip.
+# chat id -> (loaded_at, window).
+_windows = OrderedDict()
+_buffer_memory_class = None
+
+
+def format_answer(chunks):
+    # Same clean-up the frontend applies as it renders the stream.
+    answer = "".join(chunks).replace("|", "\n\n")
+    return re.sub(r"(?<!#)###(?!#)", lambda m: m.group(0) if m.start() == 0 else "\n\n###", answer)
+
+
+def sse_frame(text, event=None):
+    # Multi-line payloads need one data field per line to survive SSE framing.
+    # Named events (progress, timing) are skipped by clients that only read
+    # the answer.
+    frame = "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+    return frame if event is None else f"event: {event}\n" + frame
+
+
+async def generate_stream(runnable, input_text, on_complete=None, chat_id=None):
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    stats = {"first_chunk_at": None, "first_frame_at": None, "frames": 0, "bytes": 0}
+
+    chunks = []
+    pending = []
+    state = {"pending_bytes": 0, "pending_since": None, "done": False, "error": None}
+    wakeup = asyncio.Event()
+    drained = asyncio.Event()
+    drained.set()
+
+    # The producer drains the model as fast as it streams. The loop below
+    # coalesces whatever has arrived into one frame per flush, so a slow
+    # client gets fewer, larger frames instead of stalling the model.
+    async def produce():
+        try:
+            async for chunk in runnable.astream(input_text, config={"callbacks": [MetricsCallbackHandler()]}):
+                if stats["first_chunk_at"] is None:
+                    stats["first_chunk_at"] = loop.time()
+
+                chunks.append(chunk)
+                pending.append(chunk)
+                state["pending_bytes"] += len(chunk.encode())
+                if state["pending_since"] is None:
+                    state["pending_since"] = loop.time()
+                wakeup.set()
+
+                if state["pending_bytes"] >= STREAM_MAX_BUFFER_BYTES:
+                    drained.clear()
+                    await drained.wait()
+
+        except Exception as e:
+            state["error"] = e
+
+        finally:
+            state["done"] = True
+            wakeup.set()
+
+    producer = asyncio.create_task(produce())
+
+    try:
+        while True:
+            wakeup.clear()
+
+            if pending:
+                waited = loop.time() - state["pending_since"]
+                if state["done"] or stats["frames"] == 0 or state["pending_bytes"] >= STREAM_FLUSH_BYTES or waited >= STREAM_FLUSH_INTERVAL:
+                    frame = sse_frame("".join(pending))
+                    pending.clear()
+                    state["pending_bytes"] = 0
+                    state["pending_since"] = None
+                    drained.set()
+
+                    if stats["first_frame_at"] is None:
+                        stats["first_frame_at"] = loop.time()
+                    stats["frames"] += 1
+                    stats["bytes"] += len(frame)
+
+                    yield frame
+                    continue
+
+                timeout = STREAM_FLUSH_INTERVAL - waited
+
+            elif state["done"]:
+                break
+
+            else:
+                timeout = STREAM_HEARTBEAT_INTERVAL
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                if not pending:
+                    yield ": ping\n\n"
+
+        if state["error"] is not None:
+            raise state["error"]
+
+    finally:
+        producer.cancel()
+
+        # Runs on completion and on client disconnect, so partial answers are
+        # kept too.
+        if chat_id is not None and chunks:
+            answer = format_answer(chunks)
+            enqueue_message(chat_id, "assistant", answer)
+            remember_message(chat_id, "assistant", answer)
+
+        if stats["first_frame_at"] is not None:
+            observe("first_frame", stats["first_frame_at"] - started_at)
+        observe("stream", loop.time() - started_at)
+
+        print(
+            f"stream chat_id={chat_id} "
+            f"ttft_ms={_elapsed_ms(started_at, stats['first_chunk_at'])} "
+            f"first_frame_ms={_elapsed_ms(started_at, stats['first_frame_at'])} "
+            f"duration_ms={_elapsed_ms(started_at, loop.time())} "
+            f"chunks={len(chunks)} frames={stats['frames']} bytes={stats['bytes']} "
+            f"completed={state['done'] and state['error'] is None}"
+        )
+
+    if on_complete is not None:
+        on_complete(chunks)
+
+
+def _elapsed_ms(start, end):
+    return None if end is None else round((end - start) * 1000, 1)
+
+
+async def _memory_class():
+    # Imported on first use, in a thread, so the langchain package loads
+    # neither when the routers are imported nor on the event loop.
+    global _buffer_memory_class
+    if _buffer_memory_class is None:
+        def load():
+            from langchain.memory import ConversationBufferWindowMemory
+            return ConversationBufferWindowMemory
+
+        _buffer_memory_class = await asyncio.to_thread(load)
+    return _buffer_memory_class
+
+
+async def get_memory(chat_id: UUID, db: AsyncSession):
+    ConversationBufferWindowMemory = await _memory_class()
 
-def get_memory(chat_id: UUID, db: Session):
     buffer_memory = ConversationBufferWindowMemory(
         k=3,
         memory_key="buffer_history",
@@ -19,14 +177,51 @@ def get_memory(chat_id: UUID, db: Session):
         return_messages=True
     )
 
-    db_messages = db.query(models.Message).filter(
-        models.Message.chat_id == chat_id
-    ).order_by(models.Message.created_at.desc()).limit(10).all()
+    cached = _windows.get(chat_id)
+
+    if cached is None or time.monotonic() - cached[0] > MEMORY_CACHE_TTL:
+        result = await db.execute(
+            select(models.Message.id, models.Message.role, models.Message.content, models.Message.created_at).where(
+                models.Message.chat_id == chat_id
+            ).order_by(models.Message.created_at.desc()).limit(MEMORY_WINDOW)
+        )
+        rows = result.all()
+
+        # Answers still queued in the message writer are not in the DB yet.
+        stored = {row.id for row in rows}
+        messages = [(row.created_at, row.role, row.content) for row in rows]
+        messages += [
+            (item["created_at"], item["role"], item["content"])
+            for item in unflushed_messages(chat_id)
+            if item["id"] not in stored
+        ]
+        messages.sort(key=lambda message: message[0])
+        window = deque(((role, content) for _, role, content in messages), maxlen=MEMORY_WINDOW)
+
+        cached = (time.monotonic(), window)
+        _windows[chat_id] = cached
+        while len(_windows) > MEMORY_CACHE_SIZE:
+            _windows.popitem(last=False)
 
-    for msg in reversed(db_messages):
-        if msg.role == "user":
-            buffer_memory.chat_memory.add_user_message(msg.content)
+    _windows.move_to_end(chat_id)
+    window = cached[1]
+
+    for role, content in window:
+        if role == "user":
+            buffer_memory.chat_memory.add_user_message(content)
         else:
-            buffer_memory.chat_memory.add_ai_message(msg.content)
+            buffer_memory.chat_memory.add_ai_message(content)
+
+    return buffer_memory
+
+
+def remember_message(chat_id: UUID, role: str, content):
+    # Chats that are not cached are loaded from the DB, which already has the
+    # message, the next time they are needed.
+    cached = _windows.get(chat_id)
+    if cached is not None:
+        cached[1].append((role, content))
+
 
-    return buffer_memory
\ No newline at end of file
+def forget_chat(chat_id: UUID):
+    _windows.pop(chat_id, None)
\ No newline at end of file
@@ -0,0 +1,46 @@
+from dotenv import load_dotenv
+import httpx
+import os
+load_dotenv()
+
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Every pooled HTTP client handed to an SDK is registered here so the app
+# lifespan can close them all on shutdown.
+_http_clients = []
+
+
+def _pool_options(pool_size, timeout):
+    return {
+        "limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT),
+    }
+
+
+def http_client(pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT):
+    client = httpx.Client(**_pool_options(pool_size, timeout))
+    _http_clients.append(client)
+    return client
+
+
+def async_http_client(pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT):
+    client = httpx.AsyncClient(**_pool_options(pool_size, timeout))
+    _http_clients.append(client)
+    return client
+
+
+async def close_http_clients():
+    while _http_clients:
+        client = _http_clients.pop()
+        if isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+        else:
+            client.close()
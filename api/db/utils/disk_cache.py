@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+import os
+
+
+# Small persistent key/value store on SQLite. Entries are evicted least
+# recently used first once max_entries (or max_bytes of values) is exceeded,
+# and ignored once they are older than max_age seconds.
+class DiskCache:
+    def __init__(self, path, max_entries=10000, max_age=None, max_bytes=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.max_age is not None and created_at < now - self.max_age:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now, now) for key, value in items],
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache"
+            ).fetchone()
+        return {"path": self.path, "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self, now):
+        if self.max_age is not None:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.max_age,))
+
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+        if self.max_bytes is not None:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(LENGTH(value)) OVER "
+                "(ORDER BY accessed_at DESC, key) AS total FROM cache) "
+                "WHERE total > ?)",
+                (self.max_bytes,),
+            )
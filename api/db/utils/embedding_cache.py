@@ -0,0 +1,223 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from api.db.utils.disk_cache import DiskCache
+import numpy as np
+import unicodedata
+import threading
+import hashlib
+import asyncio
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+# Wraps an Embeddings model with a bounded in-memory LRU, an optional SQLite
+# tier and micro-batching: misses that arrive within batch_window_ms of each
+# other are sent to the model as one embed_documents call. The model can be
+# given as a zero-argument factory, called on first use, so importing this
+# module does not import the model's client library.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, namespace="", max_entries=4096, disk_path=None, disk_max_entries=100000, batch_window_ms=5, max_batch_size=32):
+        if isinstance(embeddings, Embeddings):
+            self._embeddings, self._factory = embeddings, None
+        else:
+            self._embeddings, self._factory = None, embeddings
+        self._model_lock = threading.Lock()
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.disk = DiskCache(disk_path, max_entries=disk_max_entries) if disk_path else None
+
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+        self._batch_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.max_batch_seen = 0
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._model_lock:
+                if self._embeddings is None:
+                    self._embeddings = self._factory()
+        return self._embeddings
+
+    def embed_documents(self, texts):
+        texts = [normalize_text(text) for text in texts]
+        vectors, missing = self._lookup_many(texts)
+
+        if missing:
+            self._record_batch(len(missing))
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                vectors[text] = self._store(text, vector)
+
+        return [vectors[text] for text in texts]
+
+    async def aembed_documents(self, texts):
+        texts = [normalize_text(text) for text in texts]
+        if self.disk is None:
+            vectors, missing = self._lookup_many(texts)
+        else:
+            vectors, missing = await asyncio.to_thread(self._lookup_many, texts)
+
+        if missing:
+            self._record_batch(len(missing))
+            embedded = await self.embeddings.aembed_documents(missing)
+            for text, vector in zip(missing, embedded):
+                vectors[text] = self._store(text, vector)
+
+        return [vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        text = normalize_text(text)
+        vector = self._cached(text)
+        if vector is not None:
+            return vector
+        return self._submit(text).result()
+
+    async def aembed_query(self, text):
+        text = normalize_text(text)
+        # The SQLite tier (a SELECT, an UPDATE and a commit) runs in a
+        # thread; the in-memory tier is checked first, on the loop.
+        vector = self._cached_in_memory(self._key(text))
+        if vector is None and self.disk is not None:
+            vector = await asyncio.to_thread(self._cached_on_disk, self._key(text))
+        if vector is not None:
+            return vector
+        return await asyncio.wrap_future(self._submit(text))
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "joined": self.joined,
+            # Lookups that did not cost a model call: cache hits plus
+            # requests merged into an embedding already in flight.
+            "hit_rate": round((hits + self.joined) / (lookups + self.joined), 4) if lookups + self.joined else 0.0,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "disk": self.disk.stats() if self.disk else None,
+        }
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode()).hexdigest()
+
+    def _cached(self, text):
+        # Misses are counted where the text is sent to the model, so requests
+        # merged into a pending embedding are not counted as misses.
+        key = self._key(text)
+        vector = self._cached_in_memory(key)
+        if vector is None and self.disk is not None:
+            vector = self._cached_on_disk(key)
+        return vector
+
+    def _cached_in_memory(self, key):
+        with self._memory_lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        return None
+
+    def _cached_on_disk(self, key):
+        blob = self.disk.get(key)
+        if blob is None:
+            return None
+        self.disk_hits += 1
+        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+        self._remember(key, vector)
+        return vector
+
+    def _lookup_many(self, texts):
+        vectors = {text: self._cached(text) for text in texts}
+        missing = list(dict.fromkeys(text for text, vector in vectors.items() if vector is None))
+        repeated = sum(1 for text in texts if vectors[text] is None) - len(missing)
+        self.misses += len(missing)
+        self.joined += repeated
+        return vectors, missing
+
+    def _store(self, text, vector):
+        key = self._key(text)
+        vector = [float(value) for value in vector]
+        self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.set(key, np.asarray(vector, dtype=np.float32).tobytes())
+        return vector
+
+    def _remember(self, key, vector):
+        with self._memory_lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _record_batch(self, size):
+        self.batches += 1
+        self.batched_texts += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+
+    def _submit(self, text):
+        with self._batch_lock:
+            future = self._pending.get(text)
+            if future is not None:
+                self.joined += 1
+                return future
+
+            self.misses += 1
+            future = Future()
+            self._pending[text] = future
+
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take_batch()
+                threading.Thread(target=self._flush, args=(batch,), daemon=True).start()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.batch_window, self._flush_pending)
+                self._timer.daemon = True
+                self._timer.start()
+
+            return future
+
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        return batch
+
+    def _flush_pending(self):
+        with self._batch_lock:
+            batch = self._take_batch()
+        self._flush(batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+
+        texts = list(batch)
+        self._record_batch(len(texts))
+
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        for text, vector in zip(texts, vectors):
+            batch[text].set_result(self._store(text, vector))
@@ -1,16 +1,37 @@
-from langchain_groq import ChatGroq
+from api.db.utils.clients import http_client, async_http_client, HTTP_POOL_SIZE, HTTP_TIMEOUT
 from dotenv import load_dotenv
+import threading
 import os
 load_dotenv()
 
+GROQ_POOL_SIZE = int(os.getenv("GROQ_POOL_SIZE", HTTP_POOL_SIZE))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", HTTP_TIMEOUT))
+
+_llm = None
+_lock = threading.Lock()
+
+
+def init_groq():
+    global _llm
+    with _lock:
+        if _llm is None:
+            from langchain_groq import ChatGroq
+
+            _llm = ChatGroq(
+                model="llama-3.3-70b-versatile",
+                groq_api_key=os.getenv("GROQ_API_KEY"),
+                temperature=0.7,
+                request_timeout=GROQ_TIMEOUT,
+                http_client=http_client(GROQ_POOL_SIZE, GROQ_TIMEOUT),
+                http_async_client=async_http_client(GROQ_POOL_SIZE, GROQ_TIMEOUT),
+            )
+        return _llm
+
+
+def close_groq():
+    global _llm
+    _llm = None
+
+
 def getGroq():
-    llm = ChatGroq(
-        model="llama-3.3-70b-versatile",
-        groq_api_key=os.getenv("GROQ_API_KEY"),
-        temperature=0.7,
-    )
-
-    try:
-        yield llm
-    finally:
-        print("lol")
\ No newline at end of file
+    return init_groq()
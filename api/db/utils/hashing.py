@@ -1,9 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import asyncio
 import hashlib
+import hmac
+import math
+import time
+import bcrypt
+import os
+load_dotenv()
+
+
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+BCRYPT_MAX_BYTES = 72
+
+# bcrypt releases the GIL, so hashing on a small pool keeps the event loop
+# free and caps how many cores a burst of sign-ins can take.
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password")
+_rounds = int(os.getenv("BCRYPT_ROUNDS")) if os.getenv("BCRYPT_ROUNDS") else None
+
+
+def calibrate_rounds(target_ms=PASSWORD_HASH_TARGET_MS):
+    # Each extra round doubles the cost, so one timing at the minimum cost
+    # is enough to find the highest cost that fits the budget.
+    started = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(MIN_BCRYPT_ROUNDS))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    extra = math.floor(math.log2(target_ms / elapsed_ms)) if elapsed_ms < target_ms else 0
+    return min(MAX_BCRYPT_ROUNDS, MIN_BCRYPT_ROUNDS + extra)
+
+
+def init_hashing():
+    global _rounds
+    if _rounds is None:
+        _rounds = calibrate_rounds()
+        print(f"bcrypt rounds calibrated to {_rounds} for a {PASSWORD_HASH_TARGET_MS:g}ms budget")
+    return _rounds
 
 
 def hash_password(password: str) -> str:
-    return hashlib.md5(password.encode()).hexdigest()
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(init_hashing())).decode()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return hash_password(plain_password) == hashed_password
\ No newline at end of file
+    if _is_bcrypt(hashed_password):
+        return bcrypt.checkpw(_secret(plain_password), hashed_password.encode())
+
+    # Accounts created before bcrypt store md5(md5(password)): sign-up hashed
+    # the password and the model hashed it again on assignment.
+    legacy = hashlib.md5(hashlib.md5(plain_password.encode()).hexdigest().encode()).hexdigest()
+    return hmac.compare_digest(legacy, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    if not _is_bcrypt(hashed_password):
+        return True
+    return int(hashed_password.split("$")[2]) < init_hashing()
+
+
+def verify_and_update(plain_password: str, hashed_password: str):
+    # Returns (matches, new_hash); new_hash is set when the stored hash is a
+    # legacy or weaker one and should be replaced.
+    if not verify_password(plain_password, hashed_password):
+        return False, None
+    if needs_rehash(hashed_password):
+        return True, hash_password(plain_password)
+    return True, None
+
+
+async def ahash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_executor, hash_password, password)
+
+
+async def averify_and_update(plain_password: str, hashed_password: str):
+    return await asyncio.get_running_loop().run_in_executor(_executor, verify_and_update, plain_password, hashed_password)
+
+
+def _secret(password):
+    # bcrypt only reads the first 72 bytes; newer releases raise instead of
+    # truncating silently.
+    return password.encode()[:BCRYPT_MAX_BYTES]
+
+
+def _is_bcrypt(hashed_password):
+    return hashed_password.startswith(("$2a$", "$2b$", "$2y$"))
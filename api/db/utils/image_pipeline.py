@@ -0,0 +1,308 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from PIL import Image, ImageOps
+from api.db.utils.disk_cache import DiskCache
+from api.db.utils.llama import describe_image
+from api.db.utils.metrics import span
+from dotenv import load_dotenv
+import asyncio
+import threading
+import hashlib
+import base64
+import time
+import os
+load_dotenv()
+
+
+IMAGE_BUCKET = "medisense-medical-images"
+UPLOADED_CACHE_SIZE = 10000
+VLM_CACHE_PATH = os.getenv("VLM_CACHE_PATH", "data/vlm_cache.sqlite3")
+VLM_CACHE_MAX_ENTRIES = int(os.getenv("VLM_CACHE_MAX_ENTRIES", "5000"))
+# Llama 3.2 Vision tiles images into 560px squares, at most 2x2 of them.
+VLM_IMAGE_MAX_SIDE = int(os.getenv("VLM_IMAGE_MAX_SIDE", "1120"))
+VLM_IMAGE_QUALITY = int(os.getenv("VLM_IMAGE_QUALITY", "90"))
+IMAGE_THUMBNAIL_SIDE = int(os.getenv("IMAGE_THUMBNAIL_SIDE", "0"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+ACCEPTED_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png"}
+# Modes Pillow converts to RGB without losing the picture.
+COLOR_MODES = {"1", "L", "LA", "P", "PA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr"}
+# 16-bit and float grayscale (exported X-rays, CT slices). convert("RGB")
+# clips these to white, so they are rescaled to 8 bits first.
+HIGH_BIT_DEPTH_MODES = {"I;16", "I;16B", "I;16L", "I", "F"}
+
+# Decoding and resizing are CPU bound; Pillow releases the GIL for most of
+# it, so a small thread pool keeps them off the event loop.
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+# (image hash, prompt) -> VLM description, kept across restarts. Opened by
+# the lifespan (or the first lookup), not at import.
+_vlm_cache = None
+_vlm_cache_lock = threading.Lock()
+
+# Object names this process has already seen in the bucket.
+_uploaded = OrderedDict()
+# Uploads left running after a VLM-cache hit, referenced until they finish.
+_background_uploads = set()
+
+
+@dataclass
+class PreparedImage:
+    content: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.content).decode('utf-8')}"
+
+
+def validate_image(path):
+    # Only parses the header; the pixels are decoded later, in the pool.
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            image_mode = image.mode
+    except Exception:
+        raise ValueError("The uploaded file is not a readable image")
+
+    if image_format not in ACCEPTED_FORMATS:
+        raise ValueError("Only JPEG and PNG images are accepted")
+    if image_mode not in COLOR_MODES and image_mode not in HIGH_BIT_DEPTH_MODES:
+        raise ValueError(f"Unsupported image mode {image_mode}")
+    return ACCEPTED_FORMATS[image_format]
+
+
+def _prepare_image(path):
+    timings = {}
+    started = time.perf_counter()
+    original_bytes = os.path.getsize(path)
+
+    image = Image.open(path)
+    original_format = image.format
+    image = ImageOps.exif_transpose(image)
+    image.load()
+    timings["decode_ms"] = _ms_since(started)
+
+    started = time.perf_counter()
+    image = _to_8bit(image)
+    resized = max(image.size) > VLM_IMAGE_MAX_SIDE
+    if resized:
+        image.thumbnail((VLM_IMAGE_MAX_SIDE, VLM_IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+    timings["resize_ms"] = _ms_since(started)
+
+    started = time.perf_counter()
+    encoded = _encode_jpeg(image, VLM_IMAGE_QUALITY)
+    timings["encode_ms"] = _ms_since(started)
+
+    # A small JPEG can come out larger after re-encoding; send it as is.
+    if not resized and original_format == "JPEG" and len(encoded) >= original_bytes:
+        with open(path, "rb") as f:
+            encoded = f.read()
+
+    return PreparedImage(
+        content=encoded,
+        mime_type="image/jpeg",
+        width=image.width,
+        height=image.height,
+        original_bytes=original_bytes,
+        timings=timings,
+    )
+
+
+def _make_thumbnail(path):
+    image = _to_8bit(ImageOps.exif_transpose(Image.open(path)))
+    image.thumbnail((IMAGE_THUMBNAIL_SIDE, IMAGE_THUMBNAIL_SIDE), Image.Resampling.LANCZOS)
+    return _encode_jpeg(image, 80)
+
+
+def _to_8bit(image):
+    # Returns an "L" or "RGB" image JPEG can hold. High-bit-depth grayscale
+    # is stretched from its own min/max to 0-255, since scans often use
+    # only 10-12 of their 16 bits.
+    if image.mode in ("RGB", "L"):
+        return image
+    if image.mode in COLOR_MODES:
+        return image.convert("RGB")
+    if image.mode not in HIGH_BIT_DEPTH_MODES:
+        raise ValueError(f"Unsupported image mode {image.mode}")
+
+    if image.mode != "F":
+        image = image.convert("I")
+    low, high = image.getextrema()
+    scale = 255 / (high - low) if high > low else 0
+    return image.point(lambda v: (v - low) * scale).convert("L")
+
+
+def _encode_jpeg(image, quality):
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _ms_since(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def prepare_image(path):
+    loop = asyncio.get_running_loop()
+    with span("vlm_preprocess"):
+        prepared = await loop.run_in_executor(_executor, _prepare_image, path)
+
+    saved = prepared.original_bytes - len(prepared.content)
+    print(
+        f"image prepared {prepared.width}x{prepared.height} "
+        f"bytes={prepared.original_bytes}->{len(prepared.content)} "
+        f"saved={saved} ({saved / prepared.original_bytes:.0%}) "
+        + " ".join(f"{stage}={ms}" for stage, ms in prepared.timings.items())
+    )
+    return prepared
+
+
+def init_vlm_cache():
+    global _vlm_cache
+    with _vlm_cache_lock:
+        if _vlm_cache is None and VLM_CACHE_PATH:
+            _vlm_cache = DiskCache(VLM_CACHE_PATH, max_entries=VLM_CACHE_MAX_ENTRIES)
+        return _vlm_cache
+
+
+def close_vlm_cache():
+    global _vlm_cache
+    with _vlm_cache_lock:
+        if _vlm_cache is not None:
+            _vlm_cache.close()
+        _vlm_cache = None
+
+
+def image_object_name(digest, file_ext):
+    return f"{digest}.{file_ext}"
+
+
+async def upload_image(supabase, image_id, path, content_type):
+    # Objects are named by content hash, so a re-upload of the same scan
+    # is skipped (or rejected as a duplicate by storage) instead of stored
+    # again. The storage client is synchronous and runs in a thread while
+    # the VLM request is in flight.
+    bucket = supabase.storage.from_(IMAGE_BUCKET)
+
+    if image_id not in _uploaded:
+        try:
+            # Given an open file, httpx streams the body from disk.
+            with span("upload"):
+                await asyncio.to_thread(_upload_file, bucket, image_id, path, content_type)
+        except Exception as e:
+            if not _is_duplicate(e):
+                raise
+
+        if IMAGE_THUMBNAIL_SIDE > 0:
+            loop = asyncio.get_running_loop()
+            thumbnail = await loop.run_in_executor(_executor, _make_thumbnail, path)
+            try:
+                await asyncio.to_thread(
+                    bucket.upload,
+                    path=f"thumbnails/{image_id.rsplit('.', 1)[0]}.jpg",
+                    file=thumbnail,
+                    file_options={"content-type": "image/jpeg"},
+                )
+            except Exception as e:
+                if not _is_duplicate(e):
+                    print(f"Thumbnail upload failed for {image_id}: {e}")
+
+        _uploaded[image_id] = True
+        while len(_uploaded) > UPLOADED_CACHE_SIZE:
+            _uploaded.popitem(last=False)
+
+    _uploaded.move_to_end(image_id)
+    return bucket.get_public_url(image_id)
+
+
+def _upload_file(bucket, image_id, path, content_type):
+    with open(path, "rb") as f:
+        bucket.upload(path=image_id, file=f, file_options={"content-type": content_type})
+
+
+def _description_key(digest, text):
+    return hashlib.sha256(f"{digest}\x00{text}".encode()).hexdigest()
+
+
+async def cached_description(digest, text):
+    vlm_cache = await asyncio.to_thread(init_vlm_cache)
+    if vlm_cache is None:
+        return None
+    cached = await asyncio.to_thread(vlm_cache.get, _description_key(digest, text))
+    return None if cached is None else cached.decode("utf-8")
+
+
+async def describe_and_cache(vlm, digest, path, text):
+    # Only called on a cache miss, so the image is only decoded and
+    # downscaled when the VLM actually needs it.
+    prepared = await prepare_image(path)
+    description = await describe_image(vlm, prepared.data_url, text)
+
+    vlm_cache = await asyncio.to_thread(init_vlm_cache)
+    if vlm_cache is not None:
+        await asyncio.to_thread(vlm_cache.set, _description_key(digest, text), description.encode("utf-8"))
+    return description
+
+
+def _upload_in_background(supabase, image_id, upload):
+    # The caller deletes its temp file as soon as it has the description, so
+    # the background upload reads from its own hard link to the same data.
+    if image_id in _uploaded:
+        return
+    path = f"{upload.path}.upload"
+    os.link(upload.path, path)
+
+    async def run():
+        try:
+            await upload_image(supabase, image_id, path, upload.content_type)
+        except Exception as e:
+            print(f"Image upload failed for {image_id}: {e}")
+        finally:
+            os.unlink(path)
+
+    task = asyncio.create_task(run())
+    _background_uploads.add(task)
+    task.add_done_callback(_background_uploads.discard)
+
+
+async def analyze_image(supabase, vlm, upload, text):
+    # upload is an IngestedUpload whose content_type has been validated.
+    file_ext = "jpg" if upload.content_type == "image/jpeg" else "png"
+    image_id = image_object_name(upload.sha256, file_ext)
+
+    # On a cache hit the diagnosis starts right away. Objects are named by
+    # content hash, so the public URL is known before the upload finishes.
+    description = await cached_description(upload.sha256, text)
+    if description is not None:
+        _upload_in_background(supabase, image_id, upload)
+        return supabase.storage.from_(IMAGE_BUCKET).get_public_url(image_id), description
+
+    upload_result, description_result = await asyncio.gather(
+        upload_image(supabase, image_id, upload.path, upload.content_type),
+        describe_and_cache(vlm, upload.sha256, upload.path, text),
+        return_exceptions=True,
+    )
+
+    # The stored object is content-addressed, so it is kept even if the VLM
+    # call fails: a retry of the same image reuses it.
+    if isinstance(description_result, BaseException):
+        raise description_result
+
+    # A failed upload should not cost the user their diagnosis; the
+    # message is stored without an image link instead.
+    if isinstance(upload_result, BaseException):
+        print(f"Image upload failed for {image_id}: {upload_result}")
+        upload_result = None
+
+    return upload_result, description_result
+
+
+def _is_duplicate(error):
+    # storage3's StorageApiError carries the storage API's statusCode.
+    return str(getattr(error, "status", "")) == "409"
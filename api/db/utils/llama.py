@@ -1,14 +1,105 @@
-from openai import OpenAI
+from api.db.utils.metrics import span
+from api.db.utils.clients import async_http_client, HTTP_POOL_SIZE, HTTP_TIMEOUT
 from dotenv import load_dotenv
+import threading
+import asyncio
 import os
 load_dotenv()
 
+VLM_POOL_SIZE = int(os.getenv("VLM_POOL_SIZE", HTTP_POOL_SIZE))
+VLM_TIMEOUT = float(os.getenv("VLM_TIMEOUT", HTTP_TIMEOUT))
+VLM_QUEUE_TIMEOUT = float(os.getenv("VLM_QUEUE_TIMEOUT", "30"))
+VLM_MAX_CONCURRENCY = int(os.getenv("VLM_MAX_CONCURRENCY", "4"))
+VLM_STREAM = os.getenv("VLM_STREAM", "false").lower() == "true"
+
+_vlm = None
+_lock = threading.Lock()
+
+# Caps in-flight requests to what the HF endpoint can serve; the rest wait
+# here instead of piling up on the endpoint.
+_vlm_slots = asyncio.Semaphore(VLM_MAX_CONCURRENCY)
+
+
+def init_llama():
+    global _vlm
+    with _lock:
+        if _vlm is None:
+            from openai import AsyncOpenAI
+
+            _vlm = AsyncOpenAI(
+                base_url = os.getenv('API_URL'),
+                api_key = os.getenv('HF_TOKEN'),
+                timeout = VLM_TIMEOUT,
+                http_client = async_http_client(VLM_POOL_SIZE, VLM_TIMEOUT),
+            )
+        return _vlm
+
+
+def close_llama():
+    global _vlm
+    _vlm = None
+
+
 def getLlama():
-    vlm = OpenAI(
-        base_url = os.getenv('API_URL'),
-        api_key = os.getenv('HF_TOKEN'),
-    )
+    return init_llama()
+
+
+async def describe_image(vlm, image_url, text, stream=VLM_STREAM, on_token=None):
     try:
-        yield vlm
+        with span("vlm_queue"):
+            await asyncio.wait_for(_vlm_slots.acquire(), VLM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TimeoutError("The vision model is busy, please try again shortly.")
+
+    try:
+        with span("vlm"):
+            return await asyncio.wait_for(_complete(vlm, image_url, text, stream, on_token), VLM_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"The vision model did not answer within {VLM_TIMEOUT:g}s.")
     finally:
-        print("lmao")
\ No newline at end of file
+        _vlm_slots.release()
+
+
+async def _complete(vlm, image_url, text, stream, on_token):
+    chat_completion = await vlm.chat.completions.create(
+        model="tgi",
+        messages=[
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": text
+                }
+            ]
+        }
+    ],
+        top_p=None,
+        temperature=0.7,
+        max_tokens=1024,
+        stream=stream,
+        seed=None,
+        stop=None,
+        frequency_penalty=None,
+        presence_penalty=None
+    )
+
+    if not stream:
+        return chat_completion.choices[0].message.content
+
+    tokens = []
+    async for chunk in chat_completion:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            tokens.append(token)
+            if on_token is not None:
+                await on_token(token)
+    return "".join(tokens)
@@ -0,0 +1,154 @@
+from typing import Any
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from api.db.utils.mmr import maximal_marginal_relevance
+from api.db.utils.metrics import span
+import numpy as np
+import asyncio
+import json
+import os
+
+
+DENSE_FILE = "dense.npy"
+SPARSE_FILE = "bm25.npz"
+DOCS_FILE = "docs.jsonl"
+SCORE_BLOCK_ROWS = 16384
+
+
+# In-memory snapshot of the medical_embeddings collection. Dense vectors are a
+# memory-mapped, L2-normalized matrix; BM25 is a CSR inverted index (term ->
+# postings) holding the same per-document weights Qdrant stores for the
+# Qdrant/BM25 encoder, with the IDF modifier applied at query time as Qdrant
+# does.
+class LocalIndex:
+    def __init__(self, path, collection_name, mmap=True):
+        self.path = path
+        self.collection_name = collection_name
+        self.dense = np.load(os.path.join(path, DENSE_FILE), mmap_mode="r" if mmap else None)
+
+        sparse = np.load(os.path.join(path, SPARSE_FILE))
+        self.term_ids = sparse["term_ids"]
+        self.indptr = sparse["indptr"]
+        self.doc_ids = sparse["doc_ids"]
+        self.weights = sparse["weights"]
+
+        self.ids = []
+        self.texts = []
+        with open(os.path.join(path, DOCS_FILE), encoding="utf-8") as f:
+            for line in f:
+                doc = json.loads(line)
+                self.ids.append(doc["id"])
+                self.texts.append(doc["text"])
+
+        n = len(self.ids)
+        df = np.diff(self.indptr).astype(np.float32)
+        self.idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def dense_scores(self, query_vector):
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        # Upcast block by block so a float16 matrix never gets copied whole.
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.dense[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores
+
+    def sparse_scores(self, indices, values):
+        scores = np.zeros(len(self), dtype=np.float32)
+        indices = np.asarray(indices, dtype=self.term_ids.dtype)
+        values = np.asarray(values, dtype=np.float32)
+
+        positions = np.searchsorted(self.term_ids, indices)
+        found = (positions < len(self.term_ids)) & (self.term_ids[np.minimum(positions, len(self.term_ids) - 1)] == indices)
+
+        for position, value in zip(positions[found], values[found]):
+            start, end = self.indptr[position], self.indptr[position + 1]
+            scores[self.doc_ids[start:end]] += value * self.idf[position] * self.weights[start:end]
+        return scores
+
+    def vectors(self, rows):
+        return np.asarray(self.dense[np.asarray(rows)], dtype=np.float32)
+
+    def document(self, row):
+        return Document(
+            page_content=self.texts[row],
+            metadata={"_id": self.ids[row], "_collection_name": self.collection_name},
+        )
+
+    def search(self, dense_query, sparse_query, k=4, fetch_k=20, search_type="mmr", lambda_mult=0.5, rrf_k=60):
+        dense_top = top_k(self.dense_scores(dense_query), fetch_k)
+        sparse_scores = self.sparse_scores(sparse_query.indices, sparse_query.values)
+        sparse_top = top_k(sparse_scores, fetch_k, positive=True)
+        candidates = reciprocal_rank_fusion([dense_top, sparse_top], rrf_k)
+
+        if search_type == "mmr":
+            candidates = candidates[:fetch_k]
+            query = np.asarray(dense_query, dtype=np.float32)
+            selected = maximal_marginal_relevance(query, self.vectors(candidates), lambda_mult=lambda_mult, k=k)
+            rows = [candidates[i] for i in selected]
+        else:
+            rows = candidates[:k]
+
+        return [self.document(int(row)) for row in rows]
+
+
+def top_k(scores, k, positive=False):
+    if positive:
+        nonzero = np.flatnonzero(scores > 0)
+        if len(nonzero) <= k:
+            return nonzero[np.argsort(-scores[nonzero], kind="stable")]
+
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    rows = np.argpartition(-scores, k - 1)[:k]
+    return rows[np.argsort(-scores[rows], kind="stable")]
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+class LocalHybridRetriever(BaseRetriever):
+    index: Any
+    embeddings: Any
+    sparse_embeddings: Any
+    search_type: str = "mmr"
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    rrf_k: int = 60
+
+    def _search(self, dense_query, sparse_query):
+        return self.index.search(
+            dense_query,
+            sparse_query,
+            k=self.k,
+            fetch_k=max(self.fetch_k, self.k),
+            search_type=self.search_type,
+            lambda_mult=self.lambda_mult,
+            rrf_k=self.rrf_k,
+        )
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        dense_query = self.embeddings.embed_query(query)
+        sparse_query = self.sparse_embeddings.embed_query(query)
+        return self._search(dense_query, sparse_query)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> list[Document]:
+        with span("embedding"):
+            dense_query = await self.embeddings.aembed_query(query)
+            sparse_query = await asyncio.to_thread(self.sparse_embeddings.embed_query, query)
+        with span("local_search"):
+            return await asyncio.to_thread(self._search, dense_query, sparse_query)
@@ -0,0 +1,135 @@
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError, OperationalError
+from api.db import models
+from api.db.database import AsyncSessionLocal
+from datetime import datetime
+from dotenv import load_dotenv
+import asyncio
+import uuid
+import os
+load_dotenv()
+
+
+MESSAGE_WRITER_BATCH_SIZE = int(os.getenv("MESSAGE_WRITER_BATCH_SIZE", "50"))
+MESSAGE_WRITER_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITER_FLUSH_INTERVAL", "0.2"))
+MESSAGE_WRITER_RETRIES = int(os.getenv("MESSAGE_WRITER_RETRIES", "5"))
+MESSAGE_WRITER_RETRY_DELAY = float(os.getenv("MESSAGE_WRITER_RETRY_DELAY", "0.5"))
+
+# Messages produced by streaming responses are queued here and inserted in
+# batches by a single background task, off the request path.
+_queue = None
+_task = None
+# chat id -> {message id: row} of messages queued but not yet written, so a
+# memory window reloaded from the DB in the meantime can still include them.
+_unflushed = {}
+
+
+def start_message_writer():
+    global _queue, _task
+    if _task is None:
+        _queue = asyncio.Queue()
+        _task = asyncio.create_task(_run())
+
+
+async def stop_message_writer():
+    global _queue, _task
+    if _task is not None:
+        await _queue.put(None)
+        await _task
+    _queue = None
+    _task = None
+
+
+def enqueue_message(chat_id, role, content, image_url=None):
+    start_message_writer()
+    item = {
+        "id": uuid.uuid4(),
+        "chat_id": chat_id,
+        "role": role,
+        "content": content,
+        "image_url": image_url,
+        # Stamped now, not at flush time, so ordering within the chat holds.
+        "created_at": datetime.utcnow(),
+    }
+    _unflushed.setdefault(chat_id, {})[item["id"]] = item
+    _queue.put_nowait(item)
+
+
+def unflushed_messages(chat_id):
+    return list(_unflushed.get(chat_id, {}).values())
+
+
+async def _run():
+    stopping = False
+    while not stopping:
+        item = await _queue.get()
+        if item is None:
+            break
+
+        batch = [item]
+        deadline = asyncio.get_running_loop().time() + MESSAGE_WRITER_FLUSH_INTERVAL
+
+        while len(batch) < MESSAGE_WRITER_BATCH_SIZE:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                item = _queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(_queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        await _write(batch)
+        _forget_flushed(batch)
+
+
+def _forget_flushed(batch):
+    # Written or given up on; either way the DB is now the source of truth.
+    for item in batch:
+        pending = _unflushed.get(item["chat_id"])
+        if pending is not None:
+            pending.pop(item["id"], None)
+            if not pending:
+                del _unflushed[item["chat_id"]]
+
+
+async def _write(batch):
+    delay = MESSAGE_WRITER_RETRY_DELAY
+    for attempt in range(MESSAGE_WRITER_RETRIES + 1):
+        try:
+            await _insert(batch)
+            return
+
+        except IntegrityError as e:
+            if len(batch) == 1:
+                print(f"Dropping message for chat {batch[0]['chat_id']}: {e.orig}")
+                return
+            # One bad row (typically a chat deleted mid-stream) fails the
+            # whole INSERT; write the rows one by one so only it is skipped.
+            for row in batch:
+                await _write([row])
+            return
+
+        except Exception as e:
+            if not _is_transient(e) or attempt == MESSAGE_WRITER_RETRIES:
+                print(f"Failed to persist {len(batch)} messages: {e}")
+                return
+            # New messages keep queueing while the writer backs off.
+            print(f"Retrying {len(batch)} messages in {delay:g}s: {e}")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+async def _insert(batch):
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(models.Message), batch)
+        await db.commit()
+
+
+def _is_transient(error):
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated
+    return isinstance(error, (OSError, asyncio.TimeoutError))
@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from dotenv import load_dotenv
+import time
+import os
+load_dotenv()
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_DURATION = Histogram(
+    "medisense_http_request_duration_seconds",
+    "Time until the response body finished, by route template.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_DURATION = Histogram(
+    "medisense_stage_duration_seconds",
+    "Time spent in one stage of the RAG or image pipeline.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Spans of the current request, shared by reference with the tasks and
+# threads it starts; None outside a request.
+_spans = ContextVar("medisense_spans", default=None)
+
+
+def observe(stage, seconds):
+    STAGE_DURATION.labels(stage=stage).observe(seconds)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def server_timing(spans, total):
+    # Repeated stages (one VLM call per image) are summed into one entry.
+    durations = {}
+    for stage, seconds in spans:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    durations["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items())
+
+
+def route_template(scope):
+    # The route template, not the raw path, keeps label cardinality bounded
+    # (chat ids are in the path). route.path lacks the router prefix, so the
+    # matched path parameters are put back into the full path instead.
+    if scope.get("route") is None:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    for name, value in (scope.get("path_params") or {}).items():
+        value = str(value)
+        segments = [f"{{{name}}}" if segment == value else segment for segment in segments]
+    return "/".join(segments)
+
+
+# Pure ASGI so streaming responses pass through untouched. Server-Timing
+# holds the spans finished before the headers go out; stages that run while
+# the body streams (retrieval and the LLM in /infer) only reach /metrics.
+class TimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        spans = []
+        token = _spans.set(spans)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(spans, time.perf_counter() - started).encode()))
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
+            REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=route_template(scope),
+                status=str(status["code"]),
+            ).observe(time.perf_counter() - started)
+
+
+# Times the retriever, prompt formatting and the chat model inside a
+# LangChain run, including time to first token. Passed as a callback to the
+# streamed runnable.
+class MetricsCallbackHandler(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self):
+        self._started = {}
+        self._first_token = set()
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start("retrieval", run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        # Only prompt templates; the other chain steps are covered by the
+        # retrieval and llm stages.
+        if kwargs.get("run_type") == "prompt":
+            self._start("prompt_build", run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start("llm", run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start("llm", run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if run_id not in self._first_token and run_id in self._started:
+            self._first_token.add(run_id)
+            observe("llm_ttft", time.perf_counter() - self._started[run_id][1])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._first_token.discard(run_id)
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._first_token.discard(run_id)
+        self._finish(run_id)
+
+    def _start(self, stage, run_id):
+        self._started[run_id] = (stage, time.perf_counter())
+
+    def _finish(self, run_id):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            stage, started_at = started
+            observe(stage, time.perf_counter() - started_at)
+
+
+def render_metrics():
+    # With several uvicorn workers, PROMETHEUS_MULTIPROC_DIR makes each
+    # scrape aggregate all of them.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+# Greedy maximal marginal relevance, batched with NumPy. The candidate
+# similarity matrix is computed once up front, and the max similarity of each
+# candidate to the selected set is updated incrementally with one row per
+# pick, so every step is a handful of vector ops instead of a Python loop over
+# the candidates. Same signature and selection order as LangChain's
+# maximal_marginal_relevance.
+def maximal_marginal_relevance(query_embedding, embedding_list, lambda_mult=0.5, k=4):
+    embeddings = np.asarray(embedding_list, dtype=np.float32)
+    k = min(k, len(embeddings))
+    if k <= 0:
+        return []
+
+    embeddings = _normalize_rows(embeddings.reshape(len(embeddings), -1))
+    query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+
+    similarity_to_query = embeddings @ query
+    similarity = embeddings @ embeddings.T
+
+    first = int(np.argmax(similarity_to_query))
+    selected = [first]
+    available = np.ones(len(embeddings), dtype=bool)
+    available[first] = False
+    max_similarity = similarity[first].copy()
+
+    relevance = lambda_mult * similarity_to_query
+    while len(selected) < k:
+        scores = relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,344 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from fastapi.encoders import jsonable_encoder
+from api.db.utils.disk_cache import DiskCache
+from datetime import datetime
+from dotenv import load_dotenv
+import threading
+import asyncio
+import json
+import uuid
+import zlib
+import os
+load_dotenv()
+
+
+PDF_PARSER = os.getenv("PDF_PARSER", "llamaparse")
+PDF_PARSE_CONCURRENCY = int(os.getenv("PDF_PARSE_CONCURRENCY", "2"))
+PDF_QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE", "100"))
+PDF_JOB_TTL = float(os.getenv("PDF_JOB_TTL", "3600"))
+PDF_MAX_JOBS = int(os.getenv("PDF_MAX_JOBS", "1000"))
+PDF_STUB_DELAY = float(os.getenv("PDF_STUB_DELAY", "0.5"))
+PDF_CACHE_PATH = os.getenv("PDF_CACHE_PATH", "data/pdf_cache.sqlite3")
+PDF_CACHE_MAX_ENTRIES = int(os.getenv("PDF_CACHE_MAX_ENTRIES", "2000"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PDF_CACHE_MAX_AGE = float(os.getenv("PDF_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+@dataclass
+class ParseJob:
+    id: str
+    filename: str
+    upload: object = field(default=None, repr=False)
+    digest: str = None
+    status: str = "queued"
+    cached: bool = False
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: datetime = None
+    finished_at: datetime = None
+    result: dict = None
+    error: str = None
+    # Jobs for the same report uploaded while this one runs; each keeps its
+    # own id and filename and mirrors this job's progress.
+    followers: list = field(default_factory=list, repr=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self, include_result=True):
+        job = {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "cached": self.cached,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+        if include_result:
+            job["result"] = self.result
+        return job
+
+    def _set_status(self, status):
+        self.status = status
+        # Wakes every waiter, then re-arms for the next change.
+        self._changed.set()
+        self._changed = asyncio.Event()
+        for follower in self.followers:
+            follower._follow(self)
+
+    def _follow(self, source):
+        self.started_at = source.started_at
+        self.finished_at = source.finished_at
+        self.error = source.error
+        self.result = _with_filename(source.result, self.filename)
+        self._set_status(source.status)
+
+
+# Parses run on a fixed pool of worker tasks fed by a bounded queue, so a
+# burst of uploads waits in line instead of holding one LlamaParse run (and
+# one HTTP connection) each. Jobs are kept in memory until PDF_JOB_TTL after
+# they finish.
+_queue = None
+_workers = []
+_jobs = OrderedDict()
+_parser = None
+
+# content hash -> parsed result. The same lab report tends to be uploaded
+# again across chats and retries; a hit skips LlamaParse entirely, and an
+# upload of a report that is already being parsed joins that job. Opened
+# with the workers (or by the first lookup), not at import.
+_report_cache = None
+_report_cache_lock = threading.Lock()
+_in_flight = {}
+_cache_stats = {"hits": 0, "joined": 0, "misses": 0}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def init_report_cache():
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None and PDF_CACHE_PATH:
+            _report_cache = DiskCache(
+                PDF_CACHE_PATH,
+                max_entries=PDF_CACHE_MAX_ENTRIES,
+                max_age=PDF_CACHE_MAX_AGE,
+                max_bytes=PDF_CACHE_MAX_BYTES,
+            )
+        return _report_cache
+
+
+def close_report_cache():
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is not None:
+            _report_cache.close()
+        _report_cache = None
+
+
+def start_pdf_workers():
+    global _queue
+    init_report_cache()
+    if not _workers:
+        _queue = asyncio.Queue(maxsize=PDF_QUEUE_SIZE)
+        for _ in range(PDF_PARSE_CONCURRENCY):
+            _workers.append(asyncio.create_task(_run()))
+
+
+async def stop_pdf_workers():
+    global _queue
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    # Jobs still queued at shutdown are dropped with their temp files.
+    while _queue is not None and not _queue.empty():
+        _queue.get_nowait().upload.close()
+    _queue = None
+    close_report_cache()
+
+
+async def submit_job(upload):
+    # Takes ownership of upload (an IngestedUpload): it stays on disk while
+    # the job is queued and is deleted once it is no longer needed.
+    start_pdf_workers()
+    _evict()
+
+    digest = upload.sha256
+
+    in_flight = _in_flight.get(digest)
+    if in_flight is not None:
+        _cache_stats["joined"] += 1
+        upload.close()
+        return _join(in_flight, upload.filename)
+
+    job = ParseJob(id=str(uuid.uuid4()), filename=upload.filename, upload=upload, digest=digest)
+
+    cached = await _cached_result(digest)
+    if cached is not None:
+        _cache_stats["hits"] += 1
+        upload.close()
+        job.upload = None
+        job.result = _with_filename(cached, upload.filename)
+        job.cached = True
+        job.started_at = job.finished_at = datetime.utcnow()
+        job.status = "done"
+        _jobs[job.id] = job
+        return job
+
+    # Checked again: the same report may have been queued during the lookup.
+    in_flight = _in_flight.get(digest)
+    if in_flight is not None:
+        _cache_stats["joined"] += 1
+        upload.close()
+        return _join(in_flight, upload.filename)
+
+    try:
+        _queue.put_nowait(job)
+    except asyncio.QueueFull:
+        upload.close()
+        raise QueueFullError("Too many reports are being parsed, please try again shortly.")
+
+    _cache_stats["misses"] += 1
+    _jobs[job.id] = job
+    _in_flight[digest] = job
+    return job
+
+
+def _join(source, filename):
+    job = ParseJob(id=str(uuid.uuid4()), filename=filename, digest=source.digest, created_at=datetime.utcnow())
+    job._follow(source)
+    source.followers.append(job)
+    _jobs[job.id] = job
+    return job
+
+
+def _with_filename(result, filename):
+    # Results are shared between uploads of the same report, and its file
+    # name (often a patient's name) belongs to one upload only.
+    if not isinstance(result, dict):
+        return result
+    result = dict(result)
+    for key in ("file_name", "filename"):
+        if key in result:
+            result[key] = filename
+    return result
+
+
+def cache_stats():
+    lookups = _cache_stats["hits"] + _cache_stats["joined"] + _cache_stats["misses"]
+    saved = _cache_stats["hits"] + _cache_stats["joined"]
+    return {
+        **_cache_stats,
+        "hit_rate": round(saved / lookups, 4) if lookups else 0.0,
+        "disk": _report_cache.stats() if _report_cache else None,
+    }
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+async def wait_for_job(job):
+    while not job.finished:
+        await job._changed.wait()
+    return job
+
+
+async def job_updates(job, heartbeat=15):
+    # Yields the job on every status change (None on idle heartbeats) and
+    # stops once it has finished.
+    while True:
+        changed = job._changed
+        yield job
+        if job.finished:
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), heartbeat)
+        except asyncio.TimeoutError:
+            yield None
+
+
+async def _run():
+    while True:
+        job = await _queue.get()
+        job.started_at = datetime.utcnow()
+        job._set_status("running")
+
+        try:
+            job.result = await parse_document(job.upload)
+            await _store_result(job.digest, job.result)
+            job.finished_at = datetime.utcnow()
+            job._set_status("done")
+        except Exception as e:
+            print(f"PDF parse failed for job {job.id}: {e}")
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            job._set_status("failed")
+        finally:
+            job.upload.close()
+            job.upload = None
+            _in_flight.pop(job.digest, None)
+            _queue.task_done()
+
+
+def _cache_key(digest):
+    # Namespaced by parser so offline stub results never answer for the
+    # real parser.
+    return f"{PDF_PARSER}:{digest}"
+
+
+async def _cached_result(digest):
+    report_cache = await asyncio.to_thread(init_report_cache)
+    if report_cache is None:
+        return None
+    blob = await asyncio.to_thread(report_cache.get, _cache_key(digest))
+    return None if blob is None else json.loads(zlib.decompress(blob))
+
+
+async def _store_result(digest, result):
+    report_cache = await asyncio.to_thread(init_report_cache)
+    if report_cache is None:
+        return
+    try:
+        blob = zlib.compress(json.dumps(_with_filename(result, None)).encode("utf-8"))
+        await asyncio.to_thread(report_cache.set, _cache_key(digest), blob)
+    except Exception as e:
+        print(f"Failed to cache parsed report {digest}: {e}")
+
+
+async def parse_document(upload):
+    if PDF_PARSER == "stub":
+        return await _parse_stub(upload)
+
+    result = await _llama_parser().aparse(upload.path, extra_info={"file_name": upload.filename})
+    return jsonable_encoder(result)
+
+
+async def _parse_stub(upload):
+    # Offline stand-in with the same shape as a LlamaParse result, for local
+    # development and load tests.
+    await asyncio.sleep(PDF_STUB_DELAY)
+    return {
+        "file_name": upload.filename,
+        "pages": [{"page": 1, "md": f"# Report\n\nParsed offline ({upload.size} bytes)."}],
+    }
+
+
+def _llama_parser():
+    global _parser
+    if _parser is None:
+        from llama_cloud_services import LlamaParse
+
+        _parser = LlamaParse(
+            api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
+            num_workers=1,
+            verbose=True,
+            language="en",
+            result_type="markdown",
+        )
+    return _parser
+
+
+def _evict():
+    now = datetime.utcnow()
+    for job_id, job in list(_jobs.items()):
+        if job.finished and (now - job.finished_at).total_seconds() > PDF_JOB_TTL:
+            del _jobs[job_id]
+
+    # Past the cap the oldest finished jobs go first; queued and running
+    # jobs are never dropped.
+    for job_id, job in list(_jobs.items()):
+        if len(_jobs) <= PDF_MAX_JOBS:
+            break
+        if job.finished:
+            del _jobs[job_id]
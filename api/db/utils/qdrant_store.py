@@ -0,0 +1,59 @@
+from langchain_qdrant import QdrantVectorStore as Qdrant
+from qdrant_client import models
+from api.db.utils.metrics import span
+import asyncio
+
+
+# MMR runs on the Qdrant server, which returns only the k selected points and
+# no vectors; re-ranking fetch_k candidates here would pull fetch_k dense
+# vectors over the network instead (see benchmarks/bench_mmr.py). The
+# collection config is validated once when the store is built rather than on
+# every search.
+class MedQdrantVectorStore(Qdrant):
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        query_embedding = self.embeddings.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(
+            query_embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, **kwargs
+        )
+
+    async def amax_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        with span("embedding"):
+            query_embedding = await self.embeddings.aembed_query(query)
+        with span("qdrant"):
+            return await asyncio.to_thread(
+                self.max_marginal_relevance_search_by_vector,
+                query_embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, **kwargs
+            )
+
+    def max_marginal_relevance_search_with_score_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, filter=None, search_params=None, score_threshold=None, consistency=None, **kwargs):
+        results = self.client.query_points(
+            collection_name=self.collection_name,
+            query=models.NearestQuery(
+                nearest=embedding,
+                # Qdrant's diversity is LangChain's 1 - lambda_mult (0 means
+                # pure relevance); langchain-qdrant passes lambda_mult as is.
+                mmr=models.Mmr(diversity=1 - lambda_mult, candidates_limit=fetch_k),
+            ),
+            query_filter=filter,
+            search_params=search_params,
+            limit=k,
+            with_payload=True,
+            with_vectors=False,
+            score_threshold=score_threshold,
+            consistency=consistency,
+            using=self.vector_name,
+            **kwargs,
+        ).points
+
+        return [
+            (
+                self._document_from_point(
+                    result,
+                    self.collection_name,
+                    self.content_payload_key,
+                    self.metadata_payload_key,
+                ),
+                result.score,
+            )
+            for result in results
+        ]
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from langchain_core.runnables import RunnableGenerator
+from dotenv import load_dotenv
+import numpy as np
+import threading
+import time
+import os
+load_dotenv()
+
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+
+
+@dataclass
+class CachedAnswer:
+    scope: str
+    query: str
+    context: str
+    chunks: list
+    vector: np.ndarray
+    created_at: float = field(default_factory=time.monotonic)
+
+
+# Past (query, context, answer) triples, looked up by cosine similarity of the
+# query embedding within the scope (user) that produced them. Only opening
+# questions of a chat are cached: a follow-up's answer depends on that
+# chat's history, which the key does not capture. Each scope keeps
+# a matrix of its normalized vectors so a lookup is one matrix-vector product.
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL, max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._indexes = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, scope, embedding):
+        query = _normalize(embedding)
+
+        with self._lock:
+            self._expire()
+            ids, matrix = self._index(scope)
+
+            if not ids:
+                self.misses += 1
+                return None
+
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]
+
+    def add(self, scope, embedding, query, context, chunks):
+        entry = CachedAnswer(
+            scope=scope,
+            query=query,
+            context=context,
+            chunks=list(chunks),
+            vector=_normalize(embedding),
+        )
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = entry
+            self._scopes.setdefault(scope, set()).add(entry_id)
+            self._indexes.pop(scope, None)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self, scope=None):
+        with self._lock:
+            ids = list(self._entries) if scope is None else list(self._scopes.get(scope, ()))
+            for entry_id in ids:
+                self._remove(entry_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "scopes": len(self._scopes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _index(self, scope):
+        if scope not in self._indexes:
+            ids = sorted(self._scopes.get(scope, ()))
+            matrix = np.stack([self._entries[i].vector for i in ids]) if ids else None
+            self._indexes[scope] = (ids, matrix)
+        return self._indexes[scope]
+
+    def _expire(self):
+        if self.ttl <= 0:
+            return
+
+        # Entries are in LRU order, not insertion order, so scan them all.
+        deadline = time.monotonic() - self.ttl
+        expired = [i for i, entry in self._entries.items() if entry.created_at < deadline]
+        for entry_id in expired:
+            self._remove(entry_id)
+            self.evictions += 1
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        scope_ids = self._scopes[entry.scope]
+        scope_ids.discard(entry_id)
+        if not scope_ids:
+            del self._scopes[entry.scope]
+        self._indexes.pop(entry.scope, None)
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def cached_runnable(entry):
+    async def replay(_):
+        for chunk in entry.chunks:
+            yield chunk
+
+    return RunnableGenerator(replay)
+
+
+semantic_cache = SemanticCache()
@@ -1,15 +1,40 @@
-from supabase import create_client
+from api.db.utils.clients import http_client, HTTP_POOL_SIZE, HTTP_TIMEOUT
+import threading
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", HTTP_POOL_SIZE))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", HTTP_TIMEOUT))
+
+_supabase = None
+_lock = threading.Lock()
+
+
+def init_supabase():
+    global _supabase
+    with _lock:
+        if _supabase is None:
+            from supabase import create_client, ClientOptions
+
+            _supabase = create_client(
+                SUPABASE_URL,
+                SUPABASE_KEY,
+                options=ClientOptions(
+                    postgrest_client_timeout=SUPABASE_TIMEOUT,
+                    storage_client_timeout=int(SUPABASE_TIMEOUT),
+                    httpx_client=http_client(SUPABASE_POOL_SIZE, SUPABASE_TIMEOUT),
+                ),
+            )
+        return _supabase
+
+
+def close_supabase():
+    global _supabase
+    _supabase = None
 
 
 def getSupabase():
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        yield supabase
-    finally:
-        print("lol")
\ No newline at end of file
+    return init_supabase()
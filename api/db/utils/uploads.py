@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from dotenv import load_dotenv
+import tempfile
+import asyncio
+import hashlib
+import os
+load_dotenv()
+
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_PDF_UPLOAD_BYTES = int(os.getenv("MAX_PDF_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+# An upload copied to a temp file on disk, one chunk at a time, with its
+# sha256 computed on the way. Consumers (Supabase, Pillow, LlamaParse) open
+# the file by path, so at most UPLOAD_CHUNK_SIZE bytes of it are held in
+# memory here whatever the size of the file.
+#
+# Starlette has already spooled a multipart file over 1 MB to its own temp
+# file, so large uploads are written to disk twice. That copy is kept on
+# purpose: Starlette's spool file is anonymous (no path to hand to LlamaParse
+# or to open twice for the concurrent upload and VLM preprocessing), and it
+# is closed when the response is sent, while PDF jobs and streamed image
+# batches outlive that. It is the disk write user-014 had removed from the
+# single-image path, traded for bounded memory on large scans.
+@dataclass
+class IngestedUpload:
+    path: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+async def ingest_upload(file, max_bytes):
+    # Starlette knows the size once the multipart body is parsed; oversized
+    # files are rejected before anything is copied.
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(_too_large(file.filename, max_bytes))
+
+    suffix = os.path.splitext(file.filename or "")[1]
+    destination = tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_TMP_DIR)
+
+    # One worker thread does the whole copy, straight from the spooled file,
+    # instead of a thread hop per chunk through UploadFile.read.
+    try:
+        with destination:
+            size, sha256 = await asyncio.to_thread(_copy, file.file, destination, file.filename, max_bytes)
+
+    except BaseException:
+        os.unlink(destination.name)
+        raise
+
+    finally:
+        await file.close()
+
+    return IngestedUpload(
+        path=destination.name,
+        filename=file.filename,
+        content_type=file.content_type,
+        size=size,
+        sha256=sha256,
+    )
+
+
+def _copy(source, destination, filename, max_bytes):
+    digest = hashlib.sha256()
+    size = 0
+    source.seek(0)
+
+    while True:
+        chunk = source.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(_too_large(filename, max_bytes))
+
+        digest.update(chunk)
+        destination.write(chunk)
+
+    return size, digest.hexdigest()
+
+
+def _too_large(filename, max_bytes):
+    return f"{filename or 'The upload'} is larger than the {max_bytes // (1024 * 1024)} MB limit"
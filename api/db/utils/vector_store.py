@@ -1,33 +1,177 @@
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
-from langchain_qdrant import QdrantVectorStore as Qdrant, FastEmbedSparse, RetrievalMode
+from api.db.utils.embedding_cache import CachedEmbeddings
+from api.db.utils.local_retriever import LocalIndex, LocalHybridRetriever
+import httpx
+import threading
+import time
 import os
 load_dotenv()
 
 
-embeddings = HuggingFaceEndpointEmbeddings(
-    model=os.getenv("EMBEDDING_ENDPOINT"),
-    huggingfacehub_api_token=os.getenv("HF_TOKEN")
+COLLECTION_NAME = "medical_embeddings"
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "20"))
+DEFAULT_TOP_K = int(os.getenv("RETRIEVER_TOP_K", "5"))
+DEFAULT_SEARCH_TYPE = os.getenv("RETRIEVER_SEARCH_TYPE", "mmr")
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "qdrant")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "data/medical_embeddings")
+
+
+# The embedding client, the BM25 model and the Qdrant client are built on
+# first use (or by the startup warm-up), not at import time: together they
+# take seconds to import and FastEmbed may download its model.
+def _endpoint_embeddings():
+    from langchain_huggingface import HuggingFaceEndpointEmbeddings
+
+    return HuggingFaceEndpointEmbeddings(
+        model=os.getenv("EMBEDDING_ENDPOINT"),
+        huggingfacehub_api_token=os.getenv("HF_TOKEN")
+    )
+
+
+embeddings = CachedEmbeddings(
+    _endpoint_embeddings,
+    namespace=os.getenv("EMBEDDING_ENDPOINT", ""),
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+    disk_path=os.getenv("EMBEDDING_CACHE_PATH"),
+    batch_window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")),
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
 )
 
-sparse_embeddings = FastEmbedSparse(model_name="Qdrant/BM25")
-
-def vector_store(top_k=5):
-    qdrant_vs = Qdrant.from_existing_collection(
-        url=os.getenv("QDRANT_URL"),
-        api_key=os.getenv("QDRANT_API_KEY"),
-        collection_name="medical_embeddings",
-        embedding=embeddings,
-        vector_name='MedEmbed-base-v0.1',
-        sparse_embedding=sparse_embeddings,
-        sparse_vector_name='bm25',
-        retrieval_mode=RetrievalMode.HYBRID,
-        metadata_payload_key=None,
-        content_payload_key="text",
+_sparse_embeddings = None
+_client = None
+_store = None
+_lock = threading.Lock()
+
+
+def get_sparse_embeddings():
+    global _sparse_embeddings
+
+    with _lock:
+        if _sparse_embeddings is None:
+            from langchain_qdrant import FastEmbedSparse
+
+            _sparse_embeddings = FastEmbedSparse(model_name="Qdrant/BM25")
+        return _sparse_embeddings
+
+
+def init_vector_store():
+    global _client, _store
+
+    sparse_embeddings = get_sparse_embeddings()
+
+    with _lock:
+        if _store is not None:
+            return _store
+
+        if RETRIEVER_BACKEND == "local":
+            _store = LocalIndex(LOCAL_INDEX_PATH, COLLECTION_NAME)
+            return _store
+
+        from qdrant_client import QdrantClient
+        from langchain_qdrant import RetrievalMode
+        from api.db.utils.qdrant_store import MedQdrantVectorStore
+
+        # One client per process: httpx keeps the connections alive between
+        # requests instead of paying a new TLS handshake for every question.
+        _client = QdrantClient(
+            url=os.getenv("QDRANT_URL"),
+            api_key=os.getenv("QDRANT_API_KEY"),
+            timeout=QDRANT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=QDRANT_POOL_SIZE,
+                max_keepalive_connections=QDRANT_POOL_SIZE,
+            ),
+        )
+
+        _store = MedQdrantVectorStore(
+            client=_client,
+            collection_name=COLLECTION_NAME,
+            embedding=embeddings,
+            vector_name='MedEmbed-base-v0.1',
+            sparse_embedding=sparse_embeddings,
+            sparse_vector_name='bm25',
+            retrieval_mode=RetrievalMode.HYBRID,
+            metadata_payload_key=None,
+            content_payload_key="text",
+        )
+
+        return _store
+
+
+def close_vector_store():
+    global _client, _store
+
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _store = None
+
+
+def get_vector_store():
+    if _store is None:
+        return init_vector_store()
+    return _store
+
+
+def vector_store(top_k=None, search_type=None, **search_kwargs):
+    search_kwargs["k"] = top_k or DEFAULT_TOP_K
+    search_type = search_type or DEFAULT_SEARCH_TYPE
+
+    if search_type == "mmr":
+        search_kwargs.setdefault("fetch_k", max(MMR_FETCH_K, search_kwargs["k"]))
+        search_kwargs.setdefault("lambda_mult", MMR_LAMBDA)
+
+    if RETRIEVER_BACKEND == "local":
+        return LocalHybridRetriever(
+            index=get_vector_store(),
+            embeddings=embeddings,
+            sparse_embeddings=get_sparse_embeddings(),
+            search_type=search_type,
+            **search_kwargs,
+        )
+
+    return get_vector_store().as_retriever(
+        search_type=search_type,
+        search_kwargs=search_kwargs,
     )
 
-    return qdrant_vs.as_retriever(search_type="mmr", search_kwargs={"k": top_k})
+
+def check_vector_store(warm_up=False):
+    start = time.perf_counter()
+    try:
+        store = get_vector_store()
+
+        if RETRIEVER_BACKEND == "local":
+            points_count = len(store)
+        else:
+            points_count = _client.get_collection(COLLECTION_NAME).points_count
+
+        if warm_up:
+            # Runs a real query so the embedding endpoint, the BM25 model and
+            # the Qdrant connection are all hot before the first user request.
+            vector_store(top_k=1).invoke("warm up")
+
+        return {
+            "status": "ok",
+            "backend": RETRIEVER_BACKEND,
+            "collection": COLLECTION_NAME,
+            "points_count": points_count,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "backend": RETRIEVER_BACKEND,
+            "collection": COLLECTION_NAME,
+            "detail": str(e),
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
 
 
 def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
\ No newline at end of file
+    return "\n\n".join(doc.page_content for doc in docs)
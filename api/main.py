@@ -1,14 +1,93 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api.db.database import engine, Base
+from api.db.utils.vector_store import init_vector_store, close_vector_store, check_vector_store
+from fastapi.responses import JSONResponse, Response
+from api.db.utils.message_writer import start_message_writer, stop_message_writer
+from api.db.utils.pdf_jobs import start_pdf_workers, stop_pdf_workers
+from api.db.utils.image_pipeline import init_vlm_cache, close_vlm_cache
+from api.db.utils.clients import close_http_clients
+from api.db.utils.groq import init_groq, close_groq
+from api.db.utils.llama import init_llama, close_llama
+from api.db.utils.supabase import init_supabase, close_supabase
+from api.db.utils.hashing import init_hashing
+from api.db.utils.metrics import TimingMiddleware, render_metrics
 from api.routers import authentication, chat, images
 import uvicorn
+import asyncio
+import time
+import os
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+RETRIEVER_WARMUP = os.getenv("RETRIEVER_WARMUP", "true").lower() == "true"
+
+warm_up_state = {"status": "pending", "duration_ms": None, "error": None}
+
+
+def warm_up():
+    # Imports the SDKs, builds the shared clients, calibrates bcrypt and
+    # runs one retrieval, so none of it lands on a user's first request.
+    init_hashing()
+    init_groq()
+    init_llama()
+    init_supabase()
+    init_vector_store()
+    import langchain.memory
+
+    if RETRIEVER_WARMUP:
+        print(check_vector_store(warm_up=True))
+
+
+async def run_warm_up():
+    started = time.perf_counter()
+    warm_up_state["status"] = "running"
+    try:
+        await asyncio.to_thread(warm_up)
+        warm_up_state["status"] = "ready"
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        warm_up_state["status"] = "failed"
+        warm_up_state["error"] = str(e)
+    warm_up_state["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"warm-up {warm_up_state['status']} in {warm_up_state['duration_ms']}ms")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(Base.metadata.create_all, bind=engine)
+    start_message_writer()
+    start_pdf_workers()
+    init_vlm_cache()
+
+    # "background" starts serving right away and warms up alongside; the
+    # clients are also built lazily by the first request that needs them.
+    warm_up_task = None
+    if STARTUP_WARMUP == "blocking":
+        await run_warm_up()
+    elif STARTUP_WARMUP == "background":
+        warm_up_task = asyncio.create_task(run_warm_up())
+    else:
+        warm_up_state["status"] = "ready"
+
+    yield
+
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await stop_pdf_workers()
+    close_vlm_cache()
+    await stop_message_writer()
+    close_vector_store()
+    close_groq()
+    close_llama()
+    close_supabase()
+    await close_http_clients()
 
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="MediSense",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -17,7 +96,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
+app.add_middleware(TimingMiddleware)
 
 app.include_router(authentication.router, prefix="/auth", tags=["Authentication"])
 app.include_router(chat.router, prefix="/chat", tags=["Chat"])
@@ -26,4 +107,17 @@ app.include_router(images.router, prefix="/images", tags=["Images"])
 
 @app.get("/")
 async def root():
-    return {"message": "All Okay"}
\ No newline at end of file
+    return {"message": "All Okay"}
+
+
+@app.get("/ready")
+async def ready():
+    # Readiness probe: 503 until the warm-up has finished.
+    status_code = 200 if warm_up_state["status"] == "ready" else 503
+    return JSONResponse(warm_up_state, status_code=status_code)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
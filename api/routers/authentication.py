@@ -1,18 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.routers.schemas.models import User
 from api.db.database import get_db
 from api.db import models
-from api.db.utils.hashing import *
+from api.db.queries import getUserwithEmail
+from api.db.utils.hashing import ahash_password, averify_and_update
+from sqlalchemy import update
 
 
 router = APIRouter()
 
 @router.post("/sign_up/", status_code=status.HTTP_201_CREATED)
-async def register_user(user: User, db: Session = Depends(get_db)):
+async def register_user(user: User, db: AsyncSession = Depends(get_db)):
     try:
         # Check if user already exists
-        existing_user = db.query(models.User).filter(models.User.email == user.email).first()
+        existing_user = await getUserwithEmail(db, user.email)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -20,7 +22,7 @@ async def register_user(user: User, db: Session = Depends(get_db)):
             )
 
         # Hash the password
-        hashed_password = hash_password(user.password)
+        hashed_password = await ahash_password(user.password)
         
         # Create new user
         db_user = models.User(
@@ -29,8 +31,8 @@ async def register_user(user: User, db: Session = Depends(get_db)):
         )
 
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         return {
             "message": "User created successfully",
@@ -38,8 +40,11 @@ async def register_user(user: User, db: Session = Depends(get_db)):
             "email": db_user.email
         }
 
+    except HTTPException:
+        raise
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -47,23 +52,33 @@ async def register_user(user: User, db: Session = Depends(get_db)):
 
 
 @router.post("/sign_in/")
-async def sign_in(user: User, db: Session = Depends(get_db)):
+async def sign_in(user: User, db: AsyncSession = Depends(get_db)):
     try:
-        existing_user = db.query(models.User).filter(models.User.email == user.email).first()
+        existing_user = await getUserwithEmail(db, user.email)
         if not existing_user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        hashed_password = hash_password(user.password)
+        matches, new_hash = await averify_and_update(user.password, existing_user.password)
 
-        if not verify_password(hashed_password, existing_user.password):
+        if not matches:
             raise HTTPException(status_code=401, detail="Incorrect password")
 
+        # Legacy MD5 and under-cost hashes are upgraded on a successful login.
+        if new_hash is not None:
+            await db.execute(
+                update(models.User).where(models.User.id == existing_user.id).values(password=new_hash)
+            )
+            await db.commit()
+
         return {
             "message": "User signed in successfully",
             "user_id": str(existing_user.id),
             "email": existing_user.email
         }
 
+    except HTTPException:
+        raise
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
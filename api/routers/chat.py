@@ -1,32 +1,72 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, Response, Header
 from fastapi.responses import StreamingResponse
-from api.routers.schemas.models import Message, Chat
+from api.routers.schemas.models import Message, Chat, ListView
 from api.db.database import get_db
-from sqlalchemy.orm import Session
-from langchain_groq import ChatGroq
+from sqlalchemy import update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.db import models
-from api.db.utils.vector_store import *
+from api.db.utils.vector_store import embeddings, vector_store, format_docs, check_vector_store
 from api.db.utils.groq import getGroq
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from api.db.queries import getMessagesByChatId, getChatbyUserId, getChatById
-from api.db.utils.chat_utils import generate_stream, get_memory
-from llama_cloud_services import LlamaParse
-import os
-import tempfile
+from api.db.queries import getMessagesByChatId, getChatbyUserId, getChatById, decode_cursor
+from api.db.utils.chat_utils import generate_stream, get_memory, remember_message, forget_chat, sse_frame
+from api.db.utils.semantic_cache import semantic_cache, cached_runnable, SEMANTIC_CACHE_ENABLED
+from api.db.utils.pdf_jobs import submit_job, get_job, wait_for_job, job_updates, cache_stats as pdf_cache_stats, QueueFullError
+from api.db.utils.chat_list_cache import chat_list_cache, etag_matches
+from api.db.utils.metrics import span
+from api.db.utils.uploads import ingest_upload, UploadTooLargeError, MAX_PDF_UPLOAD_BYTES
+from typing import TYPE_CHECKING
+import asyncio
+import json
 from uuid import UUID
 
+if TYPE_CHECKING:
+    from langchain_groq import ChatGroq
+
 router = APIRouter()
 
 
+def validate_cursor(after):
+    if after is None:
+        return
+    try:
+        decode_cursor(after)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
 @router.get("/")
-async def get_chats(user_id: UUID, db: Session = Depends(get_db)):
+async def get_chats(user_id: UUID, limit: int = Query(None, ge=1, le=200), after: str = None, view: ListView = ListView.full, if_none_match: str = Header(None), db: AsyncSession = Depends(get_db)):
+    validate_cursor(after)
     try:
-        chats = getChatbyUserId(db, user_id)
-        if not chats:
-            raise HTTPException(status_code=404, detail="No chats found for this user.")
-        return chats
+        key = (limit, after, view.value)
+        entry = chat_list_cache.get(user_id, key)
+
+        if entry is None:
+            version = chat_list_cache.version(user_id)
+            chats, cursor = await getChatbyUserId(db, user_id, limit=limit, after=after, summary=view == ListView.summary)
+            # An empty page after a cursor is the normal end of the list.
+            if not chats and after is None:
+                raise HTTPException(status_code=404, detail="No chats found for this user.")
+            entry = chat_list_cache.set(user_id, key, version, chats, cursor)
+
+        headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        if entry.cursor:
+            headers["X-Next-Cursor"] = entry.cursor
+
+        if etag_matches(if_none_match, entry.etag):
+            chat_list_cache.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
+
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -36,30 +76,36 @@ async def get_chats(user_id: UUID, db: Session = Depends(get_db)):
 
 
 @router.post("/create")
-async def create_chat(chat: Chat, db: Session = Depends(get_db)):
+async def create_chat(chat: Chat, db: AsyncSession = Depends(get_db)):
     try:
-        #chat.user_id = UUID(chat.user_id)
-
-        existing_chat = db.query(models.Chat).filter(models.Chat.title == chat.title and models.Chat.user_id == chat.user_id).first()
-        if existing_chat:
+        # One round trip: the unique (user_id, title) index both answers the
+        # duplicate check and makes it race-free.
+        result = await db.execute(
+            insert(models.Chat).values(
+                title=chat.title,
+                user_id=chat.user_id,
+            ).on_conflict_do_nothing(
+                index_elements=[models.Chat.user_id, models.Chat.title],
+            ).returning(models.Chat)
+        )
+        db_chat = result.scalars().first()
+        if db_chat is None:
             raise HTTPException(
                 status_code=400,
                 detail="Chat with this title already exists"
             )
 
-        db_chat = models.Chat(
-            title=chat.title,
-            user_id=chat.user_id,
-        )
-
-        db.add(db_chat)
-        db.commit()
-        db.refresh(db_chat)
+        await db.commit()
+        chat_list_cache.invalidate(chat.user_id)
 
         return db_chat
 
+    except HTTPException:
+        await db.rollback()
+        raise
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(e)
         raise HTTPException(
             status_code=500,
@@ -68,19 +114,35 @@ async def create_chat(chat: Chat, db: Session = Depends(get_db)):
 
 
 @router.patch("/update/{chat_id}")
-async def update_chat(chat_id: UUID, title: str, db: Session = Depends(get_db)):
+async def update_chat(chat_id: UUID, title: str, db: AsyncSession = Depends(get_db)):
     try:
-        chat = db.query(models.Chat).filter(models.Chat.id == chat_id).first()
+        result = await db.execute(
+            update(models.Chat).where(
+                models.Chat.id == chat_id
+            ).values(title=title).returning(models.Chat)
+        )
+        chat = result.scalars().first()
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found.")
 
-        chat.title = title
-        db.commit()
+        await db.commit()
+        chat_list_cache.invalidate(chat.user_id)
 
         return chat
 
+    except HTTPException:
+        await db.rollback()
+        raise
+
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Chat with this title already exists"
+        )
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(e)
         raise HTTPException(
             status_code=500,
@@ -89,21 +151,30 @@ async def update_chat(chat_id: UUID, title: str, db: Session = Depends(get_db)):
 
 
 @router.delete("/delete/{chat_id}")
-async def delete_chat(chat_id: UUID, db: Session = Depends(get_db)):
+async def delete_chat(chat_id: UUID, db: AsyncSession = Depends(get_db)):
     try:
-        db.query(models.Message).filter(models.Message.chat_id == chat_id).delete()
-
-        chat = db.query(models.Chat).filter(models.Chat.id == chat_id).first()
-        if not chat:
+        # Messages (and votes) go with the chat through ON DELETE CASCADE.
+        result = await db.execute(
+            delete(models.Chat).where(
+                models.Chat.id == chat_id
+            ).returning(models.Chat.user_id)
+        )
+        user_id = result.scalar()
+        if user_id is None:
             raise HTTPException(status_code=404, detail="Chat not found.")
 
-        db.delete(chat)
-        db.commit()
+        await db.commit()
+        forget_chat(chat_id)
+        chat_list_cache.invalidate(user_id)
 
         return {"message": "Chat and all associated messages deleted successfully."}
 
+    except HTTPException:
+        await db.rollback()
+        raise
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(e)
         raise HTTPException(
             status_code=500,
@@ -112,9 +183,9 @@ async def delete_chat(chat_id: UUID, db: Session = Depends(get_db)):
 
 
 @router.post("/{chat_id}/add_message")
-async def add_message(chat_id: UUID, message: Message, db: Session = Depends(get_db)):
+async def add_message(chat_id: UUID, message: Message, db: AsyncSession = Depends(get_db)):
     try:
-        chat = getChatById(db, chat_id)
+        chat = await getChatById(db, chat_id)
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found.")
 
@@ -124,13 +195,14 @@ async def add_message(chat_id: UUID, message: Message, db: Session = Depends(get
             role=message.role if message.role else "user"
         )
         db.add(db_message)
-        db.commit()
-        db.refresh(db_message)
+        await db.commit()
+        await db.refresh(db_message)
+        remember_message(chat_id, db_message.role, db_message.content)
 
         return db_message
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(e)
         raise HTTPException(
             status_code=500,
@@ -139,12 +211,20 @@ async def add_message(chat_id: UUID, message: Message, db: Session = Depends(get
 
 
 @router.get("/{chat_id}/get_messages")
-async def get_chat_messages(chat_id: UUID, db: Session = Depends(get_db)):
+async def get_chat_messages(response: Response, chat_id: UUID, limit: int = Query(None, ge=1, le=500), after: str = None, view: ListView = ListView.full, db: AsyncSession = Depends(get_db)):
+    validate_cursor(after)
     try:
-        messages = getMessagesByChatId(db, chat_id)
-        if not messages:
+        messages, cursor = await getMessagesByChatId(db, chat_id, limit=limit, after=after, summary=view == ListView.summary)
+        if not messages and after is None:
             raise HTTPException(status_code=404, detail="No messages found for this chat.")
+
+        if cursor:
+            response.headers["X-Next-Cursor"] = cursor
         return messages
+
+    except HTTPException:
+        raise
+
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -155,40 +235,108 @@ async def get_chat_messages(chat_id: UUID, db: Session = Depends(get_db)):
 
 @router.post("/parse-pdf")
 async def parse_pdf(file: UploadFile = File(...)):
-    try:
-        if file.content_type != "application/pdf":
-            raise HTTPException(400, detail="Only PDF files are accepted")
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
-
-        parser = LlamaParse(
-            api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
-            num_workers=1,
-            verbose=True,
-            language="en",
-            result_type="markdown",
-        )
+    # Kept for existing clients: submits a job and waits for it, so it shares
+    # the worker pool's concurrency limit with /parse-pdf/jobs.
+    job = await submit_pdf_job(file)
+    await wait_for_job(job)
 
-        result = await parser.aparse(temp_path)
+    if job.status == "failed":
+        raise HTTPException(500, detail=job.error)
 
-        os.unlink(temp_path)
+    return {"text": job.result}
 
-        return {"text": result}
 
-    except Exception as e:
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.unlink(temp_path)
-        print(e)
-        raise HTTPException(500, detail=str(e))
+@router.post("/parse-pdf/jobs", status_code=202)
+async def create_parse_job(file: UploadFile = File(...)):
+    job = await submit_pdf_job(file)
+    return job.to_dict(include_result=False)
+
+
+@router.get("/parse-pdf/cache/stats")
+async def parse_pdf_cache_stats():
+    return pdf_cache_stats()
+
+
+@router.get("/parse-pdf/jobs/{job_id}")
+async def get_parse_job(job_id: str):
+    return find_parse_job(job_id).to_dict()
+
+
+@router.get("/parse-pdf/jobs/{job_id}/events")
+async def parse_job_events(job_id: str):
+    job = find_parse_job(job_id)
+
+    async def stream():
+        async for update in job_updates(job):
+            if update is None:
+                yield ": ping\n\n"
+            else:
+                yield sse_frame(json.dumps(update.to_dict(include_result=update.finished)), event="status")
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def submit_pdf_job(file):
+    if file.content_type != "application/pdf":
+        raise HTTPException(400, detail="Only PDF files are accepted")
+
+    try:
+        upload = await ingest_upload(file, MAX_PDF_UPLOAD_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(413, detail=str(e))
+
+    try:
+        return await submit_job(upload)
+    except QueueFullError as e:
+        raise HTTPException(503, detail=str(e))
+
+
+def find_parse_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Parse job not found.")
+    return job
 
 
 @router.post("/{chat_id}/infer")
-async def infer_diagnosis(chat_id: UUID, message: Message, db: Session = Depends(get_db), llm: ChatGroq = Depends(getGroq)):
+async def infer_diagnosis(chat_id: UUID, message: Message, db: AsyncSession = Depends(get_db), llm: "ChatGroq" = Depends(getGroq)):
     try:
-        buffer_memory = get_memory(chat_id, db)
+        cache_scope = None
+        query_embedding = None
+
+        with span("memory"):
+            buffer_memory = await get_memory(chat_id, db)
+
+        # A cached answer was built from its own chat's history, so only
+        # opening questions (no history on either side) are looked up or
+        # stored; follow-ups like "what dose should I take?" always go to
+        # the model.
+        if SEMANTIC_CACHE_ENABLED and not buffer_memory.chat_memory.messages:
+            chat = await getChatById(db, chat_id)
+            if not chat:
+                raise HTTPException(status_code=404, detail="Chat not found.")
+
+            cache_scope = str(chat.user_id)
+            with span("embedding"):
+                query_embedding = await embeddings.aembed_query(message.content)
+            with span("semantic_cache"):
+                cached = semantic_cache.lookup(cache_scope, query_embedding)
+
+            if cached:
+                user_message = models.Message(
+                    chat_id=chat_id,
+                    content=message.content,
+                    role="user"
+                )
+
+                db.add(user_message)
+                await db.commit()
+                remember_message(chat_id, "user", message.content)
+
+                return StreamingResponse(
+                    generate_stream(cached_runnable(cached), message.content, chat_id=chat_id),
+                    media_type="text/event-stream"
+                )
 
         template = '''
         You're a compassionate AI doctor designed to help users with medical inquiries. Your primary goal is to provide accurate medical advice, recommend treatment options for various health conditions, and prioritize the well-being of individuals seeking assistance. In this particular task, your objective is to diagnose a medical condition and suggest treatment options to the user. You will be provided with the user's query, and relevant context to make an accurate assessment. Remember, if there's any uncertainty or the condition is complex, always advise the user to seek professional medical help promptly. \
@@ -200,15 +348,24 @@ async def infer_diagnosis(chat_id: UUID, message: Message, db: Session = Depends
         Here is the question: {user_input}
         '''
 
-        retriever = vector_store()
+        # The first call imports the Qdrant SDK and builds the store, and it
+        # waits on the warm-up if that is still running; both stay off the
+        # event loop.
+        retriever = await asyncio.to_thread(vector_store)
 
         prompt = ChatPromptTemplate.from_template(
             template
         )
 
+        retrieved = {}
+
+        def remember_context(context):
+            retrieved["context"] = context
+            return context
+
         runnable = (
             {
-                "context": retriever | format_docs ,
+                "context": retriever | format_docs | RunnableLambda(remember_context),
                 "user_input": RunnablePassthrough(),
                 "buffer_history": RunnableLambda(lambda x: buffer_memory.load_memory_variables(x)),
             }
@@ -223,16 +380,32 @@ async def infer_diagnosis(chat_id: UUID, message: Message, db: Session = Depends
             role="user"
         )
 
-        db.add(user_message)
-        db.commit()
+        with span("db_write"):
+            db.add(user_message)
+            await db.commit()
+        remember_message(chat_id, "user", message.content)
+
+        on_complete = None
+        if cache_scope is not None:
+            def on_complete(chunks):
+                semantic_cache.add(
+                    cache_scope,
+                    query_embedding,
+                    message.content,
+                    retrieved.get("context", ""),
+                    chunks,
+                )
 
         return StreamingResponse(
-            generate_stream(runnable, message.content),
+            generate_stream(runnable, message.content, on_complete=on_complete, chat_id=chat_id),
             media_type="text/event-stream"
         )
 
+    except HTTPException:
+        raise
+
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(e)
         raise HTTPException(
             status_code=500,
@@ -240,10 +413,33 @@ async def infer_diagnosis(chat_id: UUID, message: Message, db: Session = Depends
         )
 
 
+@router.get("/semantic_cache/stats")
+async def semantic_cache_stats():
+    return semantic_cache.stats()
+
+
+@router.get("/chat_list_cache/stats")
+async def chat_list_cache_stats():
+    return chat_list_cache.stats()
+
+
+@router.get("/embeddings/stats")
+async def embedding_cache_stats():
+    return embeddings.stats()
+
+
+@router.get("/retriever_health")
+def retriever_health(warm_up: bool = False):
+    health = check_vector_store(warm_up=warm_up)
+    if health["status"] != "ok":
+        raise HTTPException(status_code=503, detail=health)
+    return health
+
+
 @router.post("/retriever_check")
-def retriever_check(message: Message):
+def retriever_check(message: Message, top_k: int = 5, search_type: str = "mmr"):
     try:
-        retriever = vector_store()
+        retriever = vector_store(top_k=top_k, search_type=search_type)
         print('check1')
         print(message.content)
         docs = retriever.invoke(message.content)
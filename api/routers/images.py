@@ -1,93 +1,71 @@
-from openai import OpenAI
 import json
-import base64
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from uuid import UUID
-from api.db.utils.groq import getGroq
 from api.db.utils.llama import getLlama
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.db.utils.groq import getGroq
-from langchain_groq import ChatGroq
 from api.db.database import get_db
 from api.db.utils.supabase import getSupabase
-from api.db.utils.chat_utils import generate_stream, get_memory
-import tempfile
-import os
+from api.db.utils.chat_utils import generate_stream, get_memory, remember_message, sse_frame
+from api.db.utils.message_writer import enqueue_message
+from api.db.utils.image_pipeline import analyze_image, validate_image
+from api.db.utils.metrics import span
+from api.db.utils.uploads import ingest_upload, UploadTooLargeError, MAX_IMAGE_UPLOAD_BYTES
+import asyncio
 from fastapi.responses import StreamingResponse
 from langchain_core.output_parsers import StrOutputParser
 from api.db import models
-from uuid import uuid4
 from dotenv import load_dotenv
+from typing import List, TYPE_CHECKING
+import os
 load_dotenv()
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from langchain_groq import ChatGroq
+    from supabase import Client
+
 router = APIRouter()
 
-@router.post("/{chat_id}/infer/image")
-async def infer_image(chat_id: UUID, message: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db), llm: ChatGroq = Depends(getGroq), vlm: OpenAI = Depends(getLlama), supabase: Session = Depends(getSupabase)):
-    try:
-        buffer_memory = get_memory(chat_id, db)
+IMAGE_BATCH_MAX_FILES = int(os.getenv("IMAGE_BATCH_MAX_FILES", "64"))
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
 
-        if file.content_type != "image/jpeg" and file.content_type != "image/png":
-            raise HTTPException(400, detail="Only JPEG and PNG images are accepted")
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix="jpg") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
+VLM_SYSTEM_MESSAGE = """You are a specialized Vision-Language Model (VLM) trained to analyze and describe medical images, including radiology scans (e.g., X-rays, MRIs, and CT scans) and other diagnostic visuals. Your descriptions should be clear, concise, and medically accurate, focusing on identifying anatomical structures, abnormalities, and relevant clinical findings. Avoid speculation and use standard medical terminology where applicable. If findings are inconclusive, state so clearly. Your descriptions will be used to support clinical insights, not to provide a definitive diagnosis."""
 
-        with open(temp_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+async def read_image_upload(file):
+    try:
+        upload = await ingest_upload(file, MAX_IMAGE_UPLOAD_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(413, detail=str(e))
 
-        # Upload the image to Supabase storage
-        file_ext = "jpg" if file.content_type == "image/jpeg" else "png"
-        image_id = f"{uuid4()}.{file_ext}"
-        file_content = await file.read()
+    try:
+        upload.content_type = await asyncio.to_thread(validate_image, upload.path)
+    except ValueError as e:
+        upload.close()
+        raise HTTPException(400, detail=f"{file.filename}: {e}")
+    return upload
 
-        with open(temp_path, "rb") as image_file:
-            response = supabase.storage.from_("medisense-medical-images").upload(
-                path=image_id,
-                file=image_file,
-                file_options={"content-type": file.content_type}
-            )
-            
-            print(response)
 
-        image_url = supabase.storage.from_('bucket').get_public_url(image_id)
+@router.post("/{chat_id}/infer/image")
+async def infer_image(chat_id: UUID, message: str = Form(...), file: UploadFile = File(...), db: AsyncSession = Depends(get_db), llm: "ChatGroq" = Depends(getGroq), vlm: "AsyncOpenAI" = Depends(getLlama), supabase: "Client" = Depends(getSupabase)):
+    try:
+        with span("memory"):
+            buffer_memory = await get_memory(chat_id, db)
 
-        system_message = """You are a specialized Vision-Language Model (VLM) trained to analyze and describe medical images, including radiology scans (e.g., X-rays, MRIs, and CT scans) and other diagnostic visuals. Your descriptions should be clear, concise, and medically accurate, focusing on identifying anatomical structures, abnormalities, and relevant clinical findings. Avoid speculation and use standard medical terminology where applicable. If findings are inconclusive, state so clearly. Your descriptions will be used to support clinical insights, not to provide a definitive diagnosis."""
+        if file.content_type != "image/jpeg" and file.content_type != "image/png":
+            raise HTTPException(400, detail="Only JPEG and PNG images are accepted")
 
-        chat_completion = vlm.chat.completions.create(
-            model="tgi",
-            messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": system_message + "\n\n" + message
-                    }
-                ]
-            }
-        ],
-            top_p=None,
-            temperature=0.7,
-            max_tokens=1024,
-            stream=False,
-            seed=None,
-            stop=None,
-            frequency_penalty=None,
-            presence_penalty=None
-        )
-        image_description = chat_completion.choices[0].message.content
-        os.unlink(temp_path)
+        # Copied to disk once; the upload and the VLM request both read
+        # from that file and run concurrently.
+        async with await read_image_upload(file) as upload:
+            image_url, image_description = await analyze_image(
+                supabase,
+                vlm,
+                upload,
+                VLM_SYSTEM_MESSAGE + "\n\n" + message,
+            )
 
         template = '''
         You're a compassionate AI doctor designed to help users with medical inquiries. Your primary goal is to provide accurate medical advice, recommend treatment options for various health conditions, and prioritize the well-being of individuals seeking assistance. In this particular task, your objective is to diagnose a medical condition and suggest treatment options to the user. You will be provided with the user's query, and relevant context to make an accurate assessment. Remember, if there's any uncertainty or the condition is complex, always advise the user to seek professional medical help promptly.\
@@ -120,17 +98,156 @@ async def infer_image(chat_id: UUID, message: str = Form(...), file: UploadFile
             image_url=image_url
         )
 
-        db.add(user_message)
-        db.commit()
+        with span("db_write"):
+            db.add(user_message)
+            await db.commit()
+        remember_message(chat_id, "user", message)
 
         return StreamingResponse(
-            generate_stream(runnable, image_description),
+            generate_stream(runnable, image_description, chat_id=chat_id),
             media_type="text/event-stream"
         )
 
+    except HTTPException:
+        raise
+
     except Exception as e:
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.unlink(temp_path)
         print(e)
-        db.rollback()
-        raise HTTPException(500, detail=str(e))
\ No newline at end of file
+        await db.rollback()
+        raise HTTPException(500, detail=str(e))
+
+
+@router.post("/{chat_id}/infer/images")
+async def infer_images(chat_id: UUID, message: str = Form(...), files: List[UploadFile] = File(...), db: AsyncSession = Depends(get_db), llm: "ChatGroq" = Depends(getGroq), vlm: "AsyncOpenAI" = Depends(getLlama), supabase: "Client" = Depends(getSupabase)):
+    if len(files) > IMAGE_BATCH_MAX_FILES:
+        raise HTTPException(400, detail=f"At most {IMAGE_BATCH_MAX_FILES} images can be analyzed at once")
+
+    # Everything that can be rejected is checked before the stream starts,
+    # so a bad slice fails the request with a 400 instead of mid-stream.
+    # Until stream() owns them, the temp files are removed here on any
+    # failure.
+    uploads = []
+    try:
+        for file in files:
+            uploads.append(await read_image_upload(file))
+
+        with span("memory"):
+            buffer_memory = await get_memory(chat_id, db)
+        prompt_text = VLM_SYSTEM_MESSAGE + "\n\n" + message
+
+        template = '''
+        You're a compassionate AI doctor designed to help users with medical inquiries. Your primary goal is to provide accurate medical advice, recommend treatment options for various health conditions, and prioritize the well-being of individuals seeking assistance. In this particular task, your objective is to diagnose a medical condition and suggest treatment options to the user. You will be provided with the user's query, and relevant context to make an accurate assessment. Remember, if there's any uncertainty or the condition is complex, always advise the user to seek professional medical help promptly.\
+        You are given descriptions of a series of medical images from the same study. Please analyze the findings across all of them together and provide a single diagnosis and treatment options. \
+        Please be thorough in your assessment. Your responses should be clear and informative. Your guidance could potentially have a significant impact on someone's health, so accuracy and empathy are crucial in your interactions with users. Your response should be in markdown format. Ensure you add '|' with the last word of each heading, and also at the end of each paragraph and lists, so that your responses can be parsed properly. \
+
+        Previous 3 Exchanges: {buffer_history}
+
+        Descriptions of the medical images: {image_description}
+        '''
+
+        runnable = (
+            {
+                "image_description": RunnablePassthrough(),
+                "buffer_history": RunnableLambda(lambda x: buffer_memory.load_memory_variables(x)),
+            }
+            | ChatPromptTemplate.from_template(template)
+            | llm
+            | StrOutputParser()
+        )
+
+        # Bounds this request's share of the VLM; the global VLM semaphore still
+        # caps the process as a whole.
+        slots = asyncio.Semaphore(IMAGE_BATCH_CONCURRENCY)
+
+        async def analyze(index, upload):
+            async with slots:
+                started = asyncio.get_running_loop().time()
+                try:
+                    image_url, description = await analyze_image(supabase, vlm, upload, prompt_text)
+                    error = None
+                except Exception as e:
+                    image_url, description, error = None, None, str(e)
+
+                return {
+                    "index": index,
+                    "filename": upload.filename,
+                    "image_url": image_url,
+                    "description": description,
+                    "error": error,
+                    "latency_ms": round((asyncio.get_running_loop().time() - started) * 1000, 1),
+                }
+
+        async def stream():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            total = len(uploads)
+            tasks = [asyncio.create_task(analyze(i, upload)) for i, upload in enumerate(uploads)]
+            results = [None] * total
+
+            try:
+                yield sse_frame(json.dumps({"completed": 0, "total": total}), event="progress")
+
+                for completed, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+                    result = await next_result
+                    results[result["index"]] = result
+                    yield sse_frame(json.dumps({
+                        "completed": completed,
+                        "total": total,
+                        "index": result["index"],
+                        "filename": result["filename"],
+                        "status": "error" if result["error"] else "ok",
+                        "error": result["error"],
+                        "latency_ms": result["latency_ms"],
+                    }), event="progress")
+
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for upload in uploads:
+                    upload.close()
+
+            vlm_ms = round((loop.time() - started) * 1000, 1)
+            described = [result for result in results if result["error"] is None]
+
+            # The batch is one user message, so a reloaded memory window holds
+            # the same history as the cached one. The first stored image is
+            # its image_url; links to the others follow the question.
+            image_urls = [result["image_url"] for result in results if result["image_url"]]
+            content = message
+            if len(image_urls) > 1:
+                content += "\n\n" + "\n".join(
+                    f"Image {position}: {url}" for position, url in enumerate(image_urls[1:], start=2)
+                )
+            enqueue_message(chat_id, "user", content, image_url=image_urls[0] if image_urls else None)
+            remember_message(chat_id, "user", content)
+
+            if not described:
+                yield sse_frame(json.dumps({"detail": "None of the images could be analyzed"}), event="error")
+                return
+
+            image_description = "\n\n".join(
+                f"Image {result['index'] + 1} ({result['filename']}): {result['description']}"
+                for result in described
+            )
+
+            async for frame in generate_stream(runnable, image_description, chat_id=chat_id):
+                yield frame
+
+            timing = {
+                "images": [
+                    {"index": result["index"], "filename": result["filename"], "latency_ms": result["latency_ms"]}
+                    for result in results
+                ],
+                "vlm_ms": vlm_ms,
+                "total_ms": round((loop.time() - started) * 1000, 1),
+            }
+            print(f"image batch chat_id={chat_id} images={total} failed={total - len(described)} vlm_ms={vlm_ms} total_ms={timing['total_ms']}")
+            yield sse_frame(json.dumps(timing), event="timing")
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
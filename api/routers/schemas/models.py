@@ -26,6 +26,11 @@ class ChatRole(str, Enum):
     assistant = "assistant"
 
 
+class ListView(str, Enum):
+    full = "full"
+    summary = "summary"
+
+
 class Message(BaseModel):
     content: str
     role: ChatRole
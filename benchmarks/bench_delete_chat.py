@@ -0,0 +1,103 @@
+"""Compare the old and the single-statement chat deletion on large chats.
+
+Seeds chats with --messages messages each (10k by default) for a throwaway
+user in DATABASE_URL (a local, migrated Postgres), then deletes half of them
+the old way (bulk Message delete, SELECT of the chat, ORM delete) and half
+with the DELETE ... RETURNING the chat router now issues, reporting latency
+and statements sent per deletion. The user is removed at the end.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/medisense python -m benchmarks.bench_delete_chat [--chats 10] [--messages 10000]
+"""
+from sqlalchemy import create_engine, event, select, delete, text
+from sqlalchemy.orm import Session
+from api.db import models
+from dotenv import load_dotenv
+import statistics
+import argparse
+import uuid
+import time
+import os
+load_dotenv()
+
+
+def seed(engine, user_id, chats, messages):
+    chat_ids = [uuid.uuid4() for _ in range(chats)]
+    with engine.begin() as conn:
+        conn.execute(
+            models.User.__table__.insert(),
+            {"id": user_id, "email": f"bench-{user_id.hex[:12]}@example.com", "password": "-"},
+        )
+        for chat_id in chat_ids:
+            conn.execute(
+                models.Chat.__table__.insert(),
+                {"id": chat_id, "title": f"bench {chat_id}", "user_id": user_id},
+            )
+            conn.execute(
+                text(
+                    'INSERT INTO "Message" (id, chat_id, role, content, created_at) '
+                    "SELECT gen_random_uuid(), :chat_id, 'user', to_json('message ' || n), "
+                    "now() + n * interval '1 millisecond' FROM generate_series(1, :messages) AS n"
+                ),
+                {"chat_id": chat_id, "messages": messages},
+            )
+    return chat_ids
+
+
+def delete_old(session, chat_id):
+    session.execute(delete(models.Message).where(models.Message.chat_id == chat_id))
+    chat = session.execute(select(models.Chat).where(models.Chat.id == chat_id)).scalars().first()
+    session.delete(chat)
+    session.commit()
+
+
+def delete_new(session, chat_id):
+    session.execute(delete(models.Chat).where(models.Chat.id == chat_id).returning(models.Chat.user_id)).scalar()
+    session.commit()
+
+
+def run(engine, strategy, chat_ids, statements):
+    timings = []
+    counts = []
+    for chat_id in chat_ids:
+        with Session(engine) as session:
+            before = statements[0]
+            started = time.perf_counter()
+            strategy(session, chat_id)
+            timings.append((time.perf_counter() - started) * 1000)
+            counts.append(statements[0] - before)
+    return timings, counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=10000)
+    args = parser.parse_args()
+
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    statements = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(*_):
+        statements[0] += 1
+
+    user_id = uuid.uuid4()
+    try:
+        chat_ids = seed(engine, user_id, args.chats, args.messages)
+        half = len(chat_ids) // 2
+
+        for name, strategy, ids in (("old", delete_old, chat_ids[:half]), ("single statement", delete_new, chat_ids[half:])):
+            timings, counts = run(engine, strategy, ids, statements)
+            print(
+                f"{name:<17} median {statistics.median(timings):8.1f} ms  "
+                f"max {max(timings):8.1f} ms  statements/delete {statistics.mean(counts):.1f}"
+            )
+
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(models.User).where(models.User.id == user_id))
+
+
+if __name__ == "__main__":
+    main()
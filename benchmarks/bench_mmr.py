@@ -0,0 +1,126 @@
+"""Compare Qdrant's server-side MMR with fetching candidates and re-ranking them here.
+
+Seeds a throwaway collection with --points clustered vectors and, for each
+fetch_k, times the two ways MedQdrantVectorStore could run MMR: one
+query_points call with models.Mmr returning k points (what the store does),
+or fetch_k points with their dense vectors re-ranked by api.db.utils.mmr
+(what the local backend does). Reports latency, the size of the points
+returned and how often both pick the same documents. Runs against
+QDRANT_URL/QDRANT_API_KEY when set, where the transfer cost is real, and an
+in-memory client otherwise. The collection is dropped at the end.
+
+Usage:
+    QDRANT_URL=... python -m benchmarks.bench_mmr [--points 5000] [--dim 768] [--k 5] [--trials 50]
+"""
+from qdrant_client import QdrantClient, models
+from api.db.utils.mmr import maximal_marginal_relevance
+from dotenv import load_dotenv
+import numpy as np
+import argparse
+import uuid
+import time
+import os
+load_dotenv()
+
+
+FETCH_KS = (20, 100, 500)
+VECTOR_NAME = "dense"
+
+
+def seed(client, collection, points, dim, rng):
+    client.create_collection(
+        collection,
+        vectors_config={VECTOR_NAME: models.VectorParams(size=dim, distance=models.Distance.COSINE)},
+    )
+    # Clustered, like real chunks: a few topics with near-duplicates around each.
+    centers = rng.normal(size=(max(2, points // 50), dim))
+    vectors = centers[rng.integers(len(centers), size=points)] + 0.3 * rng.normal(size=(points, dim))
+    for start in range(0, points, 256):
+        client.upsert(collection, [
+            models.PointStruct(id=i, vector={VECTOR_NAME: vectors[i].tolist()}, payload={"text": f"chunk {i} " * 40})
+            for i in range(start, min(start + 256, points))
+        ])
+    return centers
+
+
+def server_mmr(client, collection, query, k, fetch_k, lambda_mult):
+    return client.query_points(
+        collection,
+        query=models.NearestQuery(nearest=query, mmr=models.Mmr(diversity=1 - lambda_mult, candidates_limit=fetch_k)),
+        using=VECTOR_NAME,
+        limit=k,
+        with_payload=True,
+    ).points
+
+
+def client_mmr(client, collection, query, k, fetch_k, lambda_mult):
+    points = client.query_points(
+        collection,
+        query=query,
+        using=VECTOR_NAME,
+        limit=fetch_k,
+        with_payload=True,
+        with_vectors=[VECTOR_NAME],
+    ).points
+    vectors = [point.vector[VECTOR_NAME] for point in points]
+    selected = maximal_marginal_relevance(np.asarray(query), vectors, lambda_mult=lambda_mult, k=k)
+    return points, [points[i] for i in selected]
+
+
+def transferred(points):
+    return sum(len(point.model_dump_json()) for point in points)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run(client, points, dim, k, trials, lambda_mult, rng):
+    collection = f"bench_mmr_{uuid.uuid4().hex[:8]}"
+    centers = seed(client, collection, points, dim, rng)
+    print(f"points={points} dim={dim} k={k} lambda_mult={lambda_mult} trials={trials}")
+    print(f"{'fetch_k':>8} {'server p50 ms':>14} {'client p50 ms':>14} {'server KB':>10} {'client KB':>10} {'same docs':>10}")
+
+    try:
+        for fetch_k in FETCH_KS:
+            server_times, client_times, server_bytes, client_bytes, matches = [], [], [], [], 0
+
+            for _ in range(trials):
+                query = (centers[0] + 0.3 * rng.normal(size=dim)).tolist()
+                server_points, server_ms = timed(server_mmr, client, collection, query, k, fetch_k, lambda_mult)
+                (fetched, client_points), client_ms = timed(client_mmr, client, collection, query, k, fetch_k, lambda_mult)
+
+                server_times.append(server_ms)
+                client_times.append(client_ms)
+                server_bytes.append(transferred(server_points))
+                client_bytes.append(transferred(fetched))
+                matches += {point.id for point in server_points} == {point.id for point in client_points}
+
+            print(
+                f"{fetch_k:>8} {np.median(server_times):>14.2f} {np.median(client_times):>14.2f} "
+                f"{np.mean(server_bytes) / 1024:>10.1f} {np.mean(client_bytes) / 1024:>10.1f} {matches / trials:>10.0%}"
+            )
+
+    finally:
+        client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if os.getenv("QDRANT_URL"):
+        client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    else:
+        print("QDRANT_URL not set; using an in-memory client, which has no network cost")
+        client = QdrantClient(":memory:")
+
+    run(client, args.points, args.dim, args.k, args.trials, args.lambda_mult, np.random.default_rng(args.seed))
@@ -0,0 +1,65 @@
+"""Time bcrypt at each cost and sign-in throughput through the hashing pool.
+
+Prints the hash time per cost factor, the cost calibrate_rounds() picks for
+PASSWORD_HASH_TARGET_MS, and how long a burst of concurrent verifications
+takes with PASSWORD_HASH_WORKERS threads while the event loop stays free.
+
+Usage:
+    python -m benchmarks.bench_password_hashing [--burst 32]
+"""
+from api.db.utils import hashing
+import argparse
+import asyncio
+import bcrypt
+import time
+
+
+def time_rounds(rounds, repeat=3):
+    salt = bcrypt.gensalt(rounds)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        bcrypt.hashpw(b"benchmark", salt)
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+async def burst(size):
+    stored = hashing.hash_password("benchmark")
+    loop = asyncio.get_running_loop()
+    lag = []
+
+    async def ticker():
+        # Measures how late a 10ms timer fires while the burst runs.
+        while True:
+            expected = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            lag.append((loop.time() - expected) * 1000)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*[hashing.averify_and_update("benchmark", stored) for _ in range(size)])
+    elapsed = time.perf_counter() - started
+    tick.cancel()
+    return elapsed, max(lag, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=32)
+    args = parser.parse_args()
+
+    for rounds in range(hashing.MIN_BCRYPT_ROUNDS, 14):
+        print(f"rounds={rounds:<3} {time_rounds(rounds):8.1f} ms")
+
+    rounds = hashing.init_hashing()
+    print(f"calibrated rounds={rounds} (target {hashing.PASSWORD_HASH_TARGET_MS:g} ms)")
+
+    elapsed, max_lag = asyncio.run(burst(args.burst))
+    print(
+        f"burst of {args.burst} sign-ins: {elapsed:.2f}s "
+        f"({args.burst / elapsed:.1f}/s, {hashing.PASSWORD_HASH_WORKERS} workers), "
+        f"max event loop lag {max_lag:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
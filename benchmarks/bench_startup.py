@@ -0,0 +1,84 @@
+"""Measure API cold start: time to first served request and time to ready.
+
+Starts `uvicorn api.main:app` in a fresh process --runs times and polls
+`/` (first request served) and `/ready` (warm-up finished) until each
+returns 200. Needs the same environment as the API (DATABASE_URL, API keys);
+set STARTUP_WARMUP=blocking to compare with warming up before serving.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--timeout 120]
+"""
+import statistics
+import subprocess
+import argparse
+import socket
+import httpx
+import time
+import sys
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(client, url, started, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def run_once(timeout):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+    )
+
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            deadline = started + timeout
+            first_request = wait_for(client, f"{base_url}/", started, deadline)
+            ready = wait_for(client, f"{base_url}/ready", started, deadline) if first_request else None
+        return first_request, ready
+
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    first_requests, readies = [], []
+    for run in range(args.runs):
+        first_request, ready = run_once(args.timeout)
+        print(f"run {run + 1}: first request {_fmt(first_request)}  ready {_fmt(ready)}")
+        if first_request is not None:
+            first_requests.append(first_request)
+        if ready is not None:
+            readies.append(ready)
+
+    if first_requests:
+        print(f"median time to first request {statistics.median(first_requests):.2f}s")
+    if readies:
+        print(f"median time to ready {statistics.median(readies):.2f}s")
+
+
+def _fmt(seconds):
+    return "timeout" if seconds is None else f"{seconds:.2f}s"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Check that the hot query paths are served by indexes.
+
+Runs EXPLAIN for the statements behind sign-in/sign-up, chat listing and
+get_memory against DATABASE_URL (a local, migrated Postgres) and exits
+non-zero if any of them falls back to a sequential scan. Sequential scans
+are disabled for the session so the planner picks an index whenever one is
+usable, even on a near-empty development database.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/medisense python -m benchmarks.check_query_plans
+"""
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+from api.db import models
+from dotenv import load_dotenv
+import uuid
+import json
+import sys
+import os
+load_dotenv()
+
+
+CHECKS = {
+    "user by email": select(models.User).where(models.User.email == "someone@example.com"),
+    "chats by user": select(models.Chat).where(
+        models.Chat.user_id == uuid.uuid4()
+    ).order_by(models.Chat.created_at, models.Chat.id),
+    "message window": select(models.Message).where(
+        models.Message.chat_id == uuid.uuid4()
+    ).order_by(models.Message.created_at.desc()).limit(10),
+    "messages by chat": select(models.Message).where(
+        models.Message.chat_id == uuid.uuid4()
+    ).order_by(models.Message.created_at, models.Message.id),
+}
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def main():
+    engine = create_engine(os.getenv("DATABASE_URL"))
+    failures = 0
+
+    with engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+
+        for name, statement in CHECKS.items():
+            sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            nodes = [node["Node Type"] for node in plan_nodes(plan[0]["Plan"])]
+            ok = "Seq Scan" not in nodes
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: {' -> '.join(nodes)}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Export the Qdrant collection into the on-disk layout read by LocalIndex.
+
+Usage:
+    python -m scripts.export_qdrant_snapshot data/medical_embeddings [--float16]
+"""
+from api.db.utils.local_retriever import DENSE_FILE, SPARSE_FILE, DOCS_FILE
+from qdrant_client import QdrantClient
+from dotenv import load_dotenv
+import numpy as np
+import argparse
+import json
+import os
+load_dotenv()
+
+
+COLLECTION_NAME = "medical_embeddings"
+DENSE_VECTOR = "MedEmbed-base-v0.1"
+SPARSE_VECTOR = "bm25"
+
+
+def export(path, float16=False, batch_size=512):
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=60)
+    count = client.count(COLLECTION_NAME, exact=True).count
+    os.makedirs(path, exist_ok=True)
+
+    dense = None
+    postings = {}
+    offset = None
+    row = 0
+
+    with open(os.path.join(path, DOCS_FILE), "w", encoding="utf-8") as docs:
+        while True:
+            points, offset = client.scroll(
+                COLLECTION_NAME,
+                limit=batch_size,
+                offset=offset,
+                with_payload=["text"],
+                with_vectors=[DENSE_VECTOR, SPARSE_VECTOR],
+            )
+
+            for point in points:
+                vector = np.asarray(point.vector[DENSE_VECTOR], dtype=np.float32)
+                if dense is None:
+                    dense = np.lib.format.open_memmap(
+                        os.path.join(path, DENSE_FILE),
+                        mode="w+",
+                        dtype=np.float16 if float16 else np.float32,
+                        shape=(count, len(vector)),
+                    )
+                dense[row] = vector / (np.linalg.norm(vector) or 1.0)
+
+                sparse = point.vector.get(SPARSE_VECTOR)
+                if sparse is not None:
+                    for term, weight in zip(sparse.indices, sparse.values):
+                        postings.setdefault(term, []).append((row, weight))
+
+                docs.write(json.dumps({"id": point.id, "text": point.payload.get("text", "")}) + "\n")
+                row += 1
+
+            print(f"exported {row}/{count}")
+            if offset is None:
+                break
+
+    dense.flush()
+
+    term_ids = np.array(sorted(postings), dtype=np.int64)
+    indptr = np.zeros(len(term_ids) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(postings[term]) for term in term_ids])
+    doc_ids = np.empty(indptr[-1], dtype=np.int32)
+    weights = np.empty(indptr[-1], dtype=np.float32)
+
+    for i, term in enumerate(term_ids):
+        entries = postings[term]
+        doc_ids[indptr[i]:indptr[i + 1]] = [doc for doc, _ in entries]
+        weights[indptr[i]:indptr[i + 1]] = [weight for _, weight in entries]
+
+    np.savez(os.path.join(path, SPARSE_FILE), term_ids=term_ids, indptr=indptr, doc_ids=doc_ids, weights=weights)
+    print(f"wrote {row} documents and {len(term_ids)} terms to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--float16", action="store_true")
+    args = parser.parse_args()
+    export(args.path, float16=args.float16)
@@ -0,0 +1,65 @@
+"""Summarize `python -X importtime` for a module, by default the API app.
+
+Runs the import in a fresh interpreter and prints the total, the slowest
+modules by cumulative time, and the cost per top-level package, so a
+dependency that starts loading at import time again shows up at the top.
+
+Usage:
+    python -m scripts.import_time_report [api.main] [--top 25] [--fail-over-ms 2500]
+"""
+import subprocess
+import argparse
+import sys
+
+
+def import_times(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"importing {module} failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("module", nargs="?", default="api.main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--fail-over-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total_ms = next(cumulative for name, _, _, cumulative in rows if name == args.module) / 1000
+
+    print(f"import {args.module}: {total_ms:.0f} ms, {len(rows)} modules\n")
+
+    print("slowest modules (cumulative):")
+    for name, depth, _, cumulative in sorted(rows, key=lambda row: -row[3])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {'  ' * min(depth, 6)}{name}")
+
+    packages = {}
+    for name, _, self_us, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    print("\nby top-level package (self time):")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+
+    if args.fail_over_ms is not None and total_ms > args.fail_over_ms:
+        raise SystemExit(f"import took {total_ms:.0f} ms, over the {args.fail_over_ms:g} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import { Textarea } from "@/components/ui/textarea";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { Image, Send, Paperclip, Bot, User, X } from "lucide-react";
 import { useToast } from "@/hooks/use-toast";
+import { readEventStream, formatAnswerText } from "@/lib/sse";
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 
@@ -47,27 +48,6 @@ export const ChatContainer = ({
     scrollToBottom();
   }, [localMessages]);
 
-  const saveAssistantMessage = async (content: string) => {
-    try {
-      const response = await fetch(`${import.meta.env.VITE_BACKEND_URL}/chat/${chatId}/add_message`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          content: content,
-          role: "assistant"
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error('Failed to save assistant message');
-      }
-    } catch (error) {
-      console.error('Error saving assistant message:', error);
-    }
-  };
-
   const parsePdfOnBackend = async (file: File): Promise<string> => {
     const formData = new FormData();
     formData.append("file", file);
@@ -150,39 +130,20 @@ export const ChatContainer = ({
         throw new Error('Failed to analyze image');
       }
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder('utf-8');
-
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value, { stream: true });
-        const lines = chunk.split("\n\n").filter(Boolean);
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            let text = line.replace("data: ", "");
-
-            if (text === "###" && fullResponse != ""){
-              text = '\n\n' + text; // Accumulate the full response
-            } else if (text.endsWith("|")) {
-              text = text.replace("|", "\n\n");
-            }
-            fullResponse += text;
-            setLocalMessages(prev => {
-              const updated = [...prev];
-              const lastMessage = updated[updated.length - 1];
-              if (lastMessage.id === assistantMessageId) {
-                lastMessage.content += text;
-              }
-              return updated;
-            });
-          }
-        }
-      }
+      await readEventStream(response.body, (data, event) => {
+        if (event !== "message") return;
 
-      await saveAssistantMessage(fullResponse);
+        const text = formatAnswerText(data, fullResponse);
+        fullResponse += text;
+        setLocalMessages(prev => {
+          const updated = [...prev];
+          const lastMessage = updated[updated.length - 1];
+          if (lastMessage.id === assistantMessageId) {
+            lastMessage.content += text;
+          }
+          return updated;
+        });
+      });
     } catch (error) {
       toast({
         title: "Error",
@@ -290,40 +251,20 @@ export const ChatContainer = ({
         throw new Error('Failed to get response from LLM');
       }
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder('utf-8');
-
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value, { stream: true });
-        const lines = chunk.split("\n\n").filter(Boolean);
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            let text = line.replace("data: ", "");
-
-            if (text === "###" && fullResponse != ""){
-              text = '\n\n' + text; // Accumulate the full response
-            } else if (text.endsWith("|")) {
-              text = text.replace("|", "\n\n");
-            }
-            fullResponse += text;
-            setLocalMessages(prev => {
-              const updated = [...prev];
-              const lastMessage = updated[updated.length - 1];
-              if (lastMessage.id === assistantMessageId) {
-                lastMessage.content += text;
-              }
-              return updated;
-            });
-          }
-        }
-      }
+      await readEventStream(response.body, (data, event) => {
+        if (event !== "message") return;
 
-      // After streaming completes, save the full response
-      await saveAssistantMessage(fullResponse);
+        const text = formatAnswerText(data, fullResponse);
+        fullResponse += text;
+        setLocalMessages(prev => {
+          const updated = [...prev];
+          const lastMessage = updated[updated.length - 1];
+          if (lastMessage.id === assistantMessageId) {
+            lastMessage.content += text;
+          }
+          return updated;
+        });
+      });
 
     } catch (error) {
       toast({
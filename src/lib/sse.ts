@@ -0,0 +1,50 @@
+// Reads a text/event-stream body and calls onEvent once per complete event,
+// with multi-line data fields joined back together as the SSE spec requires.
+export async function readEventStream(
+  body: ReadableStream<Uint8Array>,
+  onEvent: (data: string, event: string) => void
+) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder("utf-8");
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      let event = "message";
+      const data: string[] = [];
+
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith(":")) continue; // heartbeat / comment
+        if (line.startsWith("event:")) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith("data:")) {
+          data.push(line.slice(5).replace(/^ /, ""));
+        }
+      }
+
+      if (data.length > 0) {
+        onEvent(data.join("\n"), event);
+      }
+    }
+  }
+}
+
+// Turns the model's '|' paragraph markers into line breaks and puts headings
+// that arrive mid-answer on their own paragraph.
+export function formatAnswerText(text: string, answerSoFar: string) {
+  return text
+    .replace(/\|/g, "\n\n")
+    .replace(/(?<!#)###(?!#)/g, (match, offset) =>
+      answerSoFar === "" && offset === 0 ? match : "\n\n" + match
+    );
+}